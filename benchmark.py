@@ -0,0 +1,46 @@
+"""
+Times the cipher block chaining algorithm 'CBC' (7 binary digit blocks) against
+its wide block variant 'CBC56' (blocks of 8 codes, 56 binary digits).
+
+Run from this folder as:
+
+python benchmark.py [number of characters] [repeats]
+
+The key stream is generated once beforehand, so only the encryption and decryption
+of the codes is timed, with and without numpy.
+"""
+import random
+import sys
+import time
+
+import textencryptor
+
+def best_time(function, repeats):
+    """
+    Returns the shortest of "repeats" timings of function(), in seconds.
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main(n_char=10**6, repeats=5):
+    message = ''.join(random.choice(textencryptor.LIBRARY) for _ in range(n_char))
+    codes = textencryptor.message_to_codes(message)
+    key = bytes(textencryptor.key_codes(123456, len(codes)))
+    backends = [False, True] if textencryptor.np is not None else [False]
+    print(f'{n_char} characters, best of {repeats}')
+    print(f'{"numpy":>6} {"algorithm":>10} {"encrypt (s)":>12} {"decrypt (s)":>12}')
+    for use_numpy in backends:
+        textencryptor.USE_NUMPY = use_numpy
+        for algorithm in ['CBC', 'CBC56']:
+            encrypted_codes = textencryptor.encrypt_codes(codes, key, algorithm)
+            assert textencryptor.decrypt_codes(encrypted_codes, key, algorithm) == codes
+            t_encrypt = best_time(lambda: textencryptor.encrypt_codes(codes, key, algorithm), repeats)
+            t_decrypt = best_time(lambda: textencryptor.decrypt_codes(encrypted_codes, key, algorithm), repeats)
+            print(f'{str(use_numpy):>6} {algorithm:>10} {t_encrypt:12.4f} {t_decrypt:12.4f}')
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
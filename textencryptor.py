@@ -73,7 +73,24 @@ of this file.
 
 """
 
+import hashlib
+import mmap
+import os
+import re
+import struct
 import sys
+import tempfile
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+try:
+    import numpy as np
+except ImportError:# numpy is optional, it is only used to speed up the conversions. 
+    np = None
+
+BINARY_DIGITS = bytes.maketrans(b'\x00\x01', b'01')# maps the bytes 0/1 to the characters '0'/'1'.
 
 def printProgressBar(Q,tot,preText):
     """
@@ -86,6 +103,116 @@ def printProgressBar(Q,tot,preText):
     sys.stdout.write(f" {preText} [{'=' * int(n_bar * q):{n_bar}s}] ")
     sys.stdout.flush()
 
+def key_stream(seed, length_message):
+    """
+    This function creates the first "length_message" binary digits of the key-stream 
+    which starts with the binary string "seed" (of length n0). It follows exactly the
+    same rule as key_from_pin() and key_from_password(), i.e. 
+    
+    k_{j+n0} = k_{j} [+] k_{j+n0-1}
+    
+    but does not build the key one binary digit at a time. 
+    
+    Writing the rule as the polynomial p(x) = x^n0 + x^(n0-1) + 1, and using the fact 
+    that p(x)^2 = p(x^2) for binary polynomials, the key stream also satisfies 
+    
+    k_{j} = k_{j-D} [+] k_{j-D*n0}      for D = 1, 2, 4, 8, ...
+    
+    So once D*n0 binary digits of the key are known the next D binary digits can be 
+    found by XORing two blocks of the key which are already known. The block size D is
+    doubled as the key grows, and each block is computed as a single (packed) integer 
+    XOR operation. 
+    
+    Each n0 binary digits of the key fix all of the binary digits which follow them, and 
+    the rule can be run backwards, so the key stream is periodic from its very first 
+    digit. The period (at most 2^n0 - 1) is found by looking for the seed reappearing in 
+    the key as it is generated. Once it has been found the rest of the key is simply the 
+    first period of the key repeated. 
+    """
+    n0 = len(seed)
+    if n0 == 0:
+        raise ValueError('The key stream needs a seed of at least one binary digit.')
+    k = bytearray(seed, 'ascii')
+    lag = 1
+    searched = 1# the seed cannot reappear before this position of the key.
+    while len(k) < length_message:
+        le = len(k)
+        while 2*lag*n0 <= le:
+            lag *= 2
+        d = min(lag, length_message-le)
+        s1 = int.from_bytes(k[le-lag:le-lag+d], 'big')
+        s2 = int.from_bytes(k[le-lag*n0:le-lag*n0+d], 'big')
+        k += (s1 ^ s2).to_bytes(d, 'big').translate(BINARY_DIGITS)# XOR of '0'/'1' bytes is 0/1
+        period = k.find(k[:n0], searched)
+        if period != -1:
+            k = k[:period] * (length_message//period + 1)
+            break
+        searched = len(k) - n0 + 1
+    return k[:length_message].decode('ascii')
+
+def jump_key_stream(seed, start):
+    """
+    Returns the n0 binary digits of the key-stream (which starts with the binary string 
+    "seed") beginning at position "start", without generating any of the key stream 
+    before it. 
+    
+    The rule k_{j+n0} = k_{j} [+] k_{j+n0-1} means that moving one binary digit along the
+    key, x, satisfies x^n0 = x^(n0-1) + 1. Every binary digit k_{s} of the key is therefore 
+    a sum of the binary digits of the seed 
+    
+    k_{s} = c_0 k_0 [+] c_1 k_1 [+] ... [+] c_{n0-1} k_{n0-1}
+    
+    where c_0 + c_1 x + ... + c_{n0-1} x^(n0-1) is the remainder of x^s after division 
+    by x^n0 + x^(n0-1) + 1 (with binary coefficients). This remainder is found by repeated 
+    squaring, which takes ~log2(start) steps. 
+    """
+    n0 = len(seed)
+    if n0 == 0:
+        raise ValueError('The key stream needs a seed of at least one binary digit.')
+    if start < 0:
+        raise ValueError('The key stream cannot be jumped to a negative position.')
+    poly = (1 << n0) ^ (1 << (n0-1)) ^ 1
+    
+    def multiply(a, b):
+        # Product of two binary polynomials, reduced modulo poly.
+        r = 0
+        while b:
+            if b & 1:
+                r ^= a
+            b >>= 1
+            a <<= 1
+            if (a >> n0) & 1:
+                a ^= poly
+        return r
+    
+    r, x, s = 1, multiply(1, 2), start
+    while s:
+        if s & 1:
+            r = multiply(r, x)
+        x = multiply(x, x)
+        s >>= 1
+    
+    seed_bits = int(seed[::-1], 2)# bit i is the ith binary digit of the seed.
+    window = []
+    for m in range(n0):
+        window.append(str(bin(r & seed_bits).count('1') & 1))
+        r <<= 1
+        if (r >> n0) & 1:
+            r ^= poly
+    return ''.join(window)
+
+def key_stream_segment(seed, start, length_segment):
+    """
+    Returns the binary digits start, start+1, ..., start+length_segment-1 of the 
+    key-stream which starts with the binary string "seed". 
+    
+    Uses jump_key_stream() to find the key at position "start", and then key_stream()
+    to generate the segment, so the cost does not grow with "start". 
+    """
+    if start == 0:
+        return key_stream(seed, length_segment)
+    return key_stream(jump_key_stream(seed, start), length_segment)
+
 def key_from_pin(pin,length_message):
     """
     This function creates a binary key-stream of length "length_message" from an input
@@ -95,24 +222,17 @@ def key_from_pin(pin,length_message):
     
     The key stream is generated by XORing the jth and (j+n0-1)th binary digits of the 
     key stream together to get the (j+n0)th binary digit of the key. This continues until
-    the key stream is the same length as "length_message". 
+    the key stream is the same length as "length_message". The key stream itself is 
+    computed by key_stream(). 
     
     A key stream generated in this manner repeats after 2^n0 - 1 binary digits. 
     
     The idea behind this method is taken from page 65 of AVSI: Cryptography, Piper & Murphy
     """
     k = bin(pin)[2:]
-    j=0
-    n0 = len(k)
-    while j < length_message-n0:
-        s1 = int(k[j])
-        s2 = int(k[j+n0-1])
-        p = s1 ^ s2# XOR operation. 
-        k=k+str(p)
-        j+=1
-        if (100*(j+1)) % round(length_message-n0+5,-1) == 0:
-            printProgressBar(j+1,length_message-n0,"Key generation:")
-    printProgressBar(j+1,length_message-n0,"Key generation:")    
+    if length_message > len(k):
+        k = key_stream(k, length_message)
+    printProgressBar(1,1,"Key generation:")
     print()
     return k
 
@@ -126,26 +246,35 @@ def key_from_password(password,length_message):
     
     The key stream is then generated by XORing the jth and (j+n0-1)th binary digits of the 
     key stream together to get the (j+n0)th binary digit of the key. This continues until
-    the key stream is the same length as "length_message". 
+    the key stream is the same length as "length_message". The key stream itself is 
+    computed by key_stream(). 
     
     A key stream generated in this manner repeats after 2^n0 - 1 binary digits. 
     
     The idea behind this method is taken from page 65 of AVSI: Cryptography, Piper & Murphy
     """
     k = message_to_binary(password)
-    j=0
-    n0 = len(k)
-    while j < length_message-n0:
-        s1 = int(k[j])
-        s2 = int(k[j+n0-1])
-        p = s1 ^ s2
-        k=k+str(p)
-        j+=1
-        if (100*(j+1)) % round(length_message-n0+5,-1) == 0:
-            printProgressBar(j+1,length_message-n0,"Key generation:")
-    printProgressBar(j+1,length_message-n0,"Key generation:")    
+    if length_message > len(k):
+        k = key_stream(k, length_message)
+    printProgressBar(1,1,"Key generation:")
     print()
     return k
+
+def key_segment_from_pin(pin, start, length_segment):
+    """
+    Returns the segment of length "length_segment", starting at binary digit "start", 
+    of the key stream key_from_pin(pin, ...). The key stream before "start" is never 
+    generated, so a key segment near the end of a long message is as cheap as one 
+    at its beginning. 
+    """
+    return key_stream_segment(bin(pin)[2:], start, length_segment)
+
+def key_segment_from_password(password, start, length_segment):
+    """
+    Returns the segment of length "length_segment", starting at binary digit "start", 
+    of the key stream key_from_password(password, ...). 
+    """
+    return key_stream_segment(message_to_binary(password), start, length_segment)
     
 def library():
     """
@@ -175,6 +304,264 @@ def library():
         nib.append(j)
     return lib, nib
     
+LIBRARY, NUMBRARY = library()
+
+# The library lookups are built once, as translation tables for str.translate(). 
+# A message is held as 'codes': a bytes object with one numbrary integer per character. 
+CHARACTER_TO_CODE = dict.fromkeys(range(128))# ASCII characters not in the library are deleted.
+CHARACTER_TO_CODE.update({ord(char): chr(num) for char, num in zip(LIBRARY, NUMBRARY)})
+CODE_TO_CHARACTER = {num: char for char, num in zip(LIBRARY, NUMBRARY)}
+CODE_TO_BINARY = {num: bin(num)[2:].zfill(7) for num in NUMBRARY}
+BINARY_TO_CODE = {bin(num)[2:].zfill(7): num for num in NUMBRARY}
+NON_CODES = bytes(range(128, 256))
+SEVEN_DIGITS = re.compile('.{7}', re.S)
+# For reading and writing files as UTF-8 bytes. 
+MAX_WIDTH = max(len(char.encode('utf-8')) for char in LIBRARY)# bytes in the widest library character.
+ASCII_TO_CODE = bytearray(range(256))
+for char, num in zip(LIBRARY, NUMBRARY):
+    if ord(char) < 128:
+        ASCII_TO_CODE[ord(char)] = num
+ASCII_TO_CODE = bytes(ASCII_TO_CODE)
+NON_ASCII_CODES = bytes(b for b in range(128) if chr(b) not in LIBRARY)# ASCII characters not in the library.
+UTF8_CONTINUATION = bytes(range(0x80, 0xC0))# bytes which continue (rather than start) a character. 
+CODE_WIDTHS = bytes(len(CODE_TO_CHARACTER.get(num, '').encode('utf-8')) for num in range(256))# bytes.translate() table, a code -> its width in UTF-8. 
+NEWLINE_CODE = NUMBRARY[LIBRARY.index('\n')]
+INITIAL_VALUE = int('0101010', 2)# the initial value (iv) of the cipher block chaining algorithm.
+CHAIN_BLOCKS = {'CBC': 1, 'CBC56': 8}# codes per chained block of each cipher block chaining algorithm.
+CTR_BLOCK = 64# characters (or bytes) per block of the counter algorithm's key stream.
+LOW_SEVEN_BITS = bytes(b & 0x7F for b in range(256))# bytes.translate() table, a byte -> a code.
+SEGMENT_SIZE = 2**20# characters per segment when a message is split over several processes.
+CHUNK_SIZE = 2**20# characters read at a time when a file is streamed.
+KEY_CACHE_BYTES = 2**26# default size limit of the key stream cache (see KeyStreamCache()).
+KEY_STORE_BYTES = 2**30# default size limit of an on-disk key stream store (see KeyStreamStore()).
+
+# The packed binary container file format (see code_chunks_to_container()). 
+CONTAINER_MAGIC = b'PTE\x07'
+CONTAINER_VERSION = 1
+CONTAINER_HEADER = struct.Struct('>4sBBQ')# magic, version, algorithm, number of characters. 
+CONTAINER_ALGORITHMS = ['stream', 'CBC', 'CBC56', 'CTR']# index = algorithm byte of the header. 
+
+# The line index file format (see LineIndex()). 
+INDEX_MAGIC = b'PTI\x07'
+INDEX_VERSION = 2
+INDEX_HEADER = struct.Struct('>4sBQQQQ8s')# magic, version, lines per entry, number of lines, number of characters, 
+                                          # bytes and last 8 encrypted characters of the encrypted file. 
+INDEX_ENTRY = struct.Struct('>QQ8s')# character, byte offset, the 8 encrypted characters before it. 
+
+# If numpy is installed whole messages are converted in single vectorised lookups. 
+# Set USE_NUMPY = False to use the pure python conversions, the output is identical. 
+USE_NUMPY = np is not None
+if np is not None:
+    CODE_POINTS = np.array([ord(char) for char in LIBRARY], dtype='<u4')
+    CODE_LOOKUP = np.full(int(CODE_POINTS.max())+2, -1, dtype=np.int16)# last entry = not in library.
+    CODE_LOOKUP[CODE_POINTS] = NUMBRARY
+
+def message_to_codes(message):
+    """
+    Converts a message in plaintext into its 'codes', a bytes object holding 
+    the numbrary integer of each character of the message which is in the library. 
+    
+    Characters which are not in the library are dropped. 
+    """
+    if USE_NUMPY:
+        points = np.frombuffer(message.encode('utf-32-le', 'surrogatepass'), dtype='<u4')
+        codes = CODE_LOOKUP[np.minimum(points, len(CODE_LOOKUP)-1)]
+        return codes[codes >= 0].astype(np.uint8).tobytes()
+    codes = message.translate(CHARACTER_TO_CODE).encode('latin-1', 'ignore')
+    return codes.translate(None, NON_CODES)
+
+def codes_to_message(codes):
+    """
+    Converts 'codes' (numbrary integers, see message_to_codes()) back into a 
+    plaintext message. 
+    """
+    if USE_NUMPY:
+        return CODE_POINTS[np.frombuffer(codes, dtype=np.uint8)].tobytes().decode('utf-32-le')
+    return bytes(codes).decode('latin-1').translate(CODE_TO_CHARACTER)
+
+def codes_to_binary(codes):
+    """
+    Converts 'codes' into a binary string, 7 binary digits per code. 
+    """
+    if USE_NUMPY:
+        bits = np.unpackbits(np.frombuffer(codes, dtype=np.uint8)[:, None], axis=1)
+        return (bits[:, 1:] + ord('0')).tobytes().decode('ascii')
+    return bytes(codes).decode('latin-1').translate(CODE_TO_BINARY)
+
+def binary_to_codes(binary_message):
+    """
+    Converts a binary string into 'codes', 7 binary digits per code. 
+    """
+    if USE_NUMPY:
+        n_char = len(binary_message)//7
+        bits = np.frombuffer(binary_message[:7*n_char].encode('ascii'), dtype=np.uint8) - ord('0')
+        bits = np.pad(bits.reshape(n_char, 7), ((0, 0), (1, 0)))# leading 0 makes each code a byte.
+        return np.packbits(bits, axis=1).tobytes()
+    return bytes(map(BINARY_TO_CODE.__getitem__, SEVEN_DIGITS.findall(binary_message)))
+
+def utf8_to_codes(data):
+    """
+    Converts the UTF-8 bytes of a message directly into 'codes'. 
+    
+    Line endings are treated as when reading a text file ('\\r\\n' and '\\r' become '\\n').
+    Purely ASCII data (e.g. most log files) is converted with a single bytes.translate(), 
+    without ever being decoded to a string. 
+    """
+    if b'\r' in data:
+        data = data.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+    if data.isascii():
+        return data.translate(ASCII_TO_CODE, NON_ASCII_CODES)
+    return message_to_codes(bytes(data).decode('utf-8'))
+
+def codes_to_utf8(codes):
+    """
+    Converts 'codes' into the UTF-8 bytes of the message. Every library character 
+    is 1-3 bytes long in UTF-8 (at most MAX_WIDTH), which sets an upper limit on the 
+    size of a file before it is written. 
+    """
+    return codes_to_message(codes).encode('utf-8')
+
+def pack_codes(codes):
+    """
+    Packs 'codes' tightly into bytes, 7 binary digits per code (so 8 codes fill 7 bytes).
+    The last byte is padded with zeros. 
+    """
+    if USE_NUMPY:
+        bits = np.unpackbits(np.frombuffer(codes, dtype=np.uint8)[:, None], axis=1)[:, 1:]
+        return np.packbits(bits).tobytes()
+    n_bytes = (7*len(codes) + 7)//8
+    if n_bytes == 0:
+        return bytes()
+    packed = int(codes_to_binary(codes), 2) << (8*n_bytes - 7*len(codes))
+    return packed.to_bytes(n_bytes, 'big')
+
+def unpack_codes(data, n_char):
+    """
+    Unpacks the first "n_char" codes from bytes packed by pack_codes(). 
+    """
+    if USE_NUMPY:
+        bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8))[:7*n_char]
+        return (np.packbits(bits.reshape(n_char, 7), axis=1) >> 1).tobytes()
+    binary = bin(int.from_bytes(data, 'big'))[2:].zfill(8*len(data))
+    return binary_to_codes(binary[:7*n_char])
+
+def key_codes(pin, n_char, algorithm='CBC'):
+    """
+    Returns the key stream for a message of "n_char" characters as 'codes', 
+    i.e. the first 7*n_char binary digits of the key stream in blocks of 7. 
+    
+    A numeric pin gives the key stream of key_from_pin(), any other pin/password 
+    the key stream of key_from_password(). Key streams are kept in the LRU cache 
+    key_cache (see KeyStreamCache()), so repeated calls with the same pin only 
+    generate the key stream once. If key_store is set (see KeyStreamStore()) the 
+    key streams are kept on disk and shared between processes instead. 
+    
+    If algorithm == 'CTR' the key stream of the counter algorithm is returned instead 
+    (see ctr_key_stream()). 
+    """
+    if algorithm == 'CTR':
+        return key_codes_segment(key_seed(pin), 0, n_char, algorithm)
+    if key_store != None:
+        return key_store.key_codes(pin, n_char)
+    return key_cache.key_codes(pin, n_char)
+
+def key_seed(pin):
+    """
+    Returns the binary string which the key stream of "pin" starts with, i.e. the 
+    binary representation of a numeric pin, or the library binary representation
+    of a password (see key_from_pin() and key_from_password()). 
+    """
+    pin = str(pin)
+    if pin.isnumeric():
+        return bin(int(pin))[2:]
+    return codes_to_binary(message_to_codes(pin))
+
+def key_codes_segment(seed, start, n_char, algorithm='CBC'):
+    """
+    Returns the key stream (with seed "seed", see key_seed()) for the characters 
+    start, start+1, ..., start+n_char-1 of a message as 'codes'. The key stream 
+    before character "start" is never generated (see key_stream_segment()). 
+    """
+    if algorithm == 'CTR':
+        return ctr_key_stream(seed, start, n_char).translate(LOW_SEVEN_BITS)
+    return binary_to_codes(key_stream_segment(seed, 7*start, 7*n_char))
+
+def next_key_codes(window, n_char):
+    """
+    Returns the next "n_char" characters of a key stream as 'codes', together with
+    the new 'window': the n0 binary digits of the key stream which follow them. 
+    
+    "window" is the n0 binary digits of the key stream at the current position (at 
+    the very start of the key stream this is its seed, see key_seed()). As n0 binary
+    digits fix the rest of the key stream, this is all that needs to be carried from 
+    one piece of a message to the next. 
+    """
+    key = key_stream(window, 7*n_char + len(window))
+    return binary_to_codes(key[:7*n_char]), key[7*n_char:]
+
+def binary_to_bytes(binary_message):
+    """
+    Converts a binary string into bytes, 8 binary digits per byte. 
+    """
+    n_bytes = len(binary_message)//8
+    if n_bytes == 0:
+        return bytes()
+    return int(binary_message[:8*n_bytes], 2).to_bytes(n_bytes, 'big')
+
+def key_bytes(pin, n_bytes, algorithm='CBC'):
+    """
+    Returns the key stream for "n_bytes" bytes of binary data, i.e. the first 
+    8*n_bytes binary digits of the key stream in blocks of 8 (see key_codes()). 
+    """
+    if algorithm == 'CTR':
+        return ctr_key_stream(key_seed(pin), 0, n_bytes)
+    if key_store != None:
+        return key_store.key_codes(pin, n_bytes, 'bytes')
+    return key_cache.key_codes(pin, n_bytes, 'bytes')
+
+def key_bytes_segment(seed, start, n_bytes, algorithm='CBC'):
+    """
+    Returns the key stream for the bytes start, start+1, ..., start+n_bytes-1 of 
+    binary data (see key_codes_segment()). 
+    """
+    if algorithm == 'CTR':
+        return ctr_key_stream(seed, start, n_bytes)
+    return binary_to_bytes(key_stream_segment(seed, 8*start, 8*n_bytes))
+
+def next_key_bytes(window, n_bytes):
+    """
+    Returns the next "n_bytes" bytes of a key stream, together with the new 'window' 
+    (see next_key_codes()). 
+    """
+    key = key_stream(window, 8*n_bytes + len(window))
+    return binary_to_bytes(key[:8*n_bytes]), key[8*n_bytes:]
+
+def ctr_key_stream(seed, start, n_bytes):
+    """
+    Returns bytes start, start+1, ..., start+n_bytes-1 of the key stream of the 
+    counter algorithm ('CTR'), for the binary string "seed" (see key_seed()). 
+    
+    Unlike the LFSR key stream, every block of CTR_BLOCK bytes is derived only from 
+    the seed and the number of the block, i, as the keyed hash 
+    
+    blake2b(i, key=blake2b(seed))
+    
+    so any part of the key stream is generated directly, and each block of a message 
+    can be encrypted or decrypted on its own. Text uses the lowest 7 binary digits of 
+    each byte as the code of the key (see key_codes_segment()). 
+    """
+    if not seed:
+        raise ValueError('The key stream needs a seed of at least one binary digit.')
+    prf = hashlib.blake2b(key=hashlib.blake2b(seed.encode('ascii')).digest())
+    first, last = start//CTR_BLOCK, -(-(start+n_bytes)//CTR_BLOCK)
+    blocks = []
+    for i in range(first, last):
+        block = prf.copy()
+        block.update(i.to_bytes(8, 'big'))
+        blocks.append(block.digest())
+    offset = start - first*CTR_BLOCK
+    return b''.join(blocks)[offset:offset+n_bytes]
+
 def message_to_binary(message):
     """
     Takes a message in plaintext and converts into a binary string. 
@@ -182,19 +569,8 @@ def message_to_binary(message):
     to the corresponding integer in the numbrary. This integer is then
     represented as a 7 digit binary string. 
     """
-    lib, nib = library()
-    binary_message = str()
-    i, n_char = 0, len(message)
-    for char in message:
-        j = 0
-        for let in lib:
-            if char == let:
-                binary_message += bin(nib[j])[2:].zfill(7)# pads with zeros to ensure 7 digits long.
-            j+=1
-        i+=1
-        if ((i+1)*100) % round(n_char+5,-1) == 0:
-            printProgressBar(i+1,n_char,"Alpha-numeric -> binary:")
-    printProgressBar(i+1,n_char,"Alpha-numeric -> binary:")
+    binary_message = codes_to_binary(message_to_codes(message))
+    printProgressBar(1,1,"Alpha-numeric -> binary:")
     print()
     return binary_message
 
@@ -206,24 +582,12 @@ def binary_to_message(binary_message):
     are represented by an integer, and then replaced by the character in 
     the library with the equivalent numbrary integer. 
     """
-    lib, nib = library()
     text_message = str()
-    le = len(binary_message)
-    if le % 7 != 0:
+    if len(binary_message) % 7 != 0:
         print('WARNING: BINARY MESSAGE WRONG LENGTH.')
     else:
-        n_char = int(le/7)
-        for j in range(n_char):
-            binary_str = binary_message[7*j:7*(j+1)]# The binary string for a particular character
-            int_char = int(binary_str, 2)# Character converted into its integer representation
-            i = 0
-            for num in nib:
-                if num == int_char:
-                    text_message += lib[i]
-                i+=1
-            if (100*(j+1)) % round(n_char+5,-1) == 0:
-                printProgressBar(j+1,n_char,"Binary -> alpha-numeric:")
-    printProgressBar(j+1,n_char,"Binary -> alpha-numeric:")
+        text_message = codes_to_message(binary_to_codes(binary_message))
+    printProgressBar(1,1,"Binary -> alpha-numeric:")
     print()
     return text_message
 
@@ -257,6 +621,25 @@ def decrypt_binary_stream_cipher(message_in_binary, key_string):
     decrypted_binary = encrypt_binary_stream_cipher(message_in_binary, key_string)
     return decrypted_binary
 
+def encrypt_codes_stream_cipher(codes, key):
+    """
+    The stream cipher acting on 'codes' rather than on binary strings. 
+    Each code of the message is XORed with the code of the key at the same position. 
+    Gives exactly the same result as encrypt_binary_stream_cipher(). 
+    """
+    if len(codes) != len(key):
+        raise ValueError('The key provided is a different length to the message.')
+    if USE_NUMPY:
+        return np.bitwise_xor(np.frombuffer(codes, dtype=np.uint8), np.frombuffer(key, dtype=np.uint8)).tobytes()
+    encrypted_integer = int.from_bytes(codes, 'big') ^ int.from_bytes(key, 'big')
+    return encrypted_integer.to_bytes(len(codes), 'big')
+
+def decrypt_codes_stream_cipher(codes, key):
+    """
+    The stream cipher is perfectly symmetric, see decrypt_binary_stream_cipher(). 
+    """
+    return encrypt_codes_stream_cipher(codes, key)
+
 def encrypt_binary_cipher_block_chaining(message_in_binary, key_string):
     """
     This is a more sophisticated approach to encrypting a binary string.
@@ -319,10 +702,15 @@ def encrypt_binary_cipher_block_chaining(message_in_binary, key_string):
           = ((i_{j-1} [+] k_{j-1}) [+] p_{j}) [+] k_{j}
           = (((c_{j-2} [+] p_{j-1}) [+] k_{j-1}) [+] p_{j}) [+] k_{j}
           = .....
+    
+    The unrolled form of this chain is 
+    
+    c_{j} = iv [+] (p_{1} [+] k_{1}) [+] (p_{2} [+] k_{2}) [+] ... [+] (p_{j} [+] k_{j})
+    
+    i.e. a running (prefix) XOR, which is computed in bulk by 
+    encrypt_codes_cipher_block_chaining(). 
     """
     encrypted_binary = str()
-    iv = '0101010'
-    iv = int(iv,2)
     if len(message_in_binary) != len(key_string):
         print('The key provided is a different length to the message.')
     else:
@@ -330,20 +718,9 @@ def encrypt_binary_cipher_block_chaining(message_in_binary, key_string):
         if le % 7 != 0:
             print('WARNING: BINARY MESSAGE WRONG LENGTH.')
         else:
-            n_char = int(le/7)
-            for j in range(n_char):
-                p_j = int(message_in_binary[7*j:7*(j+1)], 2)
-                key_j = int(key_string[7*j:7*(j+1)], 2)
-                if j == 0:
-                    i_j = iv ^ p_j
-                else:
-                    c_j_1 = int(encrypted_binary[7*(j-1):7*j], 2)
-                    i_j = c_j_1 ^ p_j
-                encrypted_integer = key_j ^ i_j
-                encrypted_binary += bin(encrypted_integer)[2:].zfill(7)
-                if (100*(j+1)) % round(n_char+5,-1) == 0:
-                    printProgressBar(j+1,n_char,"Encrypting: ")
-    printProgressBar(j+1,n_char,"Encrypting: ")
+            encrypted_codes = encrypt_codes_cipher_block_chaining(binary_to_codes(message_in_binary), binary_to_codes(key_string))
+            encrypted_binary = codes_to_binary(encrypted_codes)
+    printProgressBar(1,1,"Encrypting: ")
     print()
     return encrypted_binary
 
@@ -380,8 +757,6 @@ def decrypt_binary_cipher_block_chaining(message_in_binary, key_string, line_bre
     
     """
     decrypted_binary = str()
-    iv = '0101010'# I must be the same as the encryption algorithm or I will fail. 
-    iv = int(iv,2)
     if len(message_in_binary) != len(key_string):
         print('The key provided is a different length to the message.')
     else:
@@ -389,32 +764,382 @@ def decrypt_binary_cipher_block_chaining(message_in_binary, key_string, line_bre
         if le % 7 != 0:
             print('WARNING: BINARY MESSAGE WRONG LENGTH.')
         else:
-            n_char = int(le/7)
-            for j in range(n_char):
-                c_j = int(message_in_binary[7*j:7*(j+1)], 2)
-                key_j = int(key_string[7*j:7*(j+1)], 2)
-                i_j = c_j ^ key_j
-                if j == 0:
-                    p_j = iv ^ i_j
-                else:
-                    c_j_1 = int(message_in_binary[7*(j-1):7*j], 2)
-                    p_j = c_j_1 ^ i_j
-                decrypted_binary += bin(p_j)[2:].zfill(7)
-                if (100*(j+1)) % round(n_char+5,-1) == 0:
-                    printProgressBar(j+1,n_char,"Decrypting:")
-    printProgressBar(j+1,n_char,"Decrypting:")
+            decrypted_codes = decrypt_codes_cipher_block_chaining(binary_to_codes(message_in_binary), binary_to_codes(key_string))
+            decrypted_binary = codes_to_binary(decrypted_codes)
+    printProgressBar(1,1,"Decrypting:")
     print()
     return decrypted_binary
 
+def chain_ivs(iv, n_char, block=1):
+    """
+    Returns the block before the first block, "iv", lined up with each of the first 
+    "n_char" codes of a message chained in blocks of "block" codes. "iv" is either an
+    integer, used for every code of the block, or the "block" codes of the block. 
+    """
+    if isinstance(iv, int):
+        iv = bytes([iv])*block
+    return (bytes(iv)*(n_char//block + 1))[:n_char]
+
+def next_iv(iv, codes, algorithm='CBC'):
+    """
+    Returns the iv which continues a cipher block chaining after the encrypted 'codes', 
+    i.e. the last encrypted block (or "iv" itself if codes is empty). 
+    """
+    block = CHAIN_BLOCKS.get(algorithm, 1)
+    return (chain_ivs(iv, block, block) + bytes(codes[-block:]))[-block:]
+
+def encrypt_codes_cipher_block_chaining(codes, key, iv=INITIAL_VALUE, block=1):
+    """
+    The cipher block chaining algorithm (see encrypt_binary_cipher_block_chaining())
+    acting on 'codes', with each code as one block. 
+    
+    Rather than looping over the blocks, the running XOR 
+    
+    c_{j} = iv [+] (p_{1} [+] k_{1}) [+] ... [+] (p_{j} [+] k_{j})
+    
+    is computed for all blocks at once. With numpy this is bitwise_xor.accumulate. 
+    Without numpy the blocks are packed into one integer, a byte per block, and the 
+    running XOR takes ~log2(number of blocks) shift and XOR operations: after XORing 
+    the integer with itself shifted by 1, 2, 4, ... blocks each block holds the XOR 
+    of all of the blocks before it. 
+    
+    "iv" is the block before the first block, and so can be used to continue a chain. 
+    
+    If block > 1 the blocks are "block" codes wide, i.e. 'CBC56' chains blocks of 8 codes
+    (56 binary digits) as single words, c_{j} = p_{j} [+] k_{j} [+] c_{j-8} for every 
+    code, with the same key stream. A last block with fewer codes is chained as the 
+    start of a full block. 
+    """
+    if len(codes) != len(key):
+        raise ValueError('The key provided is a different length to the message.')
+    n_char = len(codes)
+    ivs = chain_ivs(iv, n_char, block)
+    if USE_NUMPY:
+        i_j = np.bitwise_xor(np.frombuffer(codes, dtype=np.uint8), np.frombuffer(key, dtype=np.uint8))
+        if block == 1:
+            c_j = np.bitwise_xor.accumulate(i_j)
+        else:
+            blocks = np.zeros(-(-n_char//block)*block, dtype=np.uint8)
+            blocks[:n_char] = i_j
+            c_j = np.bitwise_xor.accumulate(blocks.reshape(-1, block), axis=0).ravel()[:n_char]
+        return (c_j ^ np.frombuffer(ivs, dtype=np.uint8)).tobytes()
+    x = int.from_bytes(codes, 'big') ^ int.from_bytes(key, 'big')
+    shift = 8*block
+    while shift < 8*n_char:
+        x ^= x >> shift
+        shift *= 2
+    x ^= int.from_bytes(ivs, 'big')
+    return x.to_bytes(n_char, 'big')
+
+def decrypt_codes_cipher_block_chaining(codes, key, iv=INITIAL_VALUE, block=1):
+    """
+    Inverts encrypt_codes_cipher_block_chaining(). Each block only depends on its 
+    own ciphertext, key and the ciphertext before it 
+    
+    p_{j} = c_{j} [+] k_{j} [+] c_{j-1}
+    
+    so all blocks are decrypted at once. 
+    """
+    if len(codes) != len(key):
+        raise ValueError('The key provided is a different length to the message.')
+    n_char = len(codes)
+    previous = (chain_ivs(iv, block, block) + bytes(codes[:n_char-block]))[:n_char]# c_{j-1} for every block. 
+    if USE_NUMPY:
+        c_j = np.frombuffer(codes, dtype=np.uint8)
+        k_j = np.frombuffer(key, dtype=np.uint8)
+        return (c_j ^ k_j ^ np.frombuffer(previous, dtype=np.uint8)).tobytes()
+    x = int.from_bytes(codes, 'big') ^ int.from_bytes(key, 'big') ^ int.from_bytes(previous, 'big')
+    return x.to_bytes(n_char, 'big')
+
+def encrypt_codes(codes, key, algorithm='CBC', iv=INITIAL_VALUE):
+    """
+    Encrypts 'codes' (see message_to_codes()) with the key stream "key" (see key_codes()).
+    Uses the cipher block chaining algorithm if algorithm == 'CBC', its wide block 
+    variant if algorithm == 'CBC56', and the stream cipher otherwise (the counter 
+    algorithm 'CTR' is the stream cipher with its own key stream, see ctr_key_stream()). 
+    "iv" is the block before the first block (cipher block chaining only, see next_iv()). 
+    
+    Both ciphers XOR whole bytes, so this equally encrypts binary data (8 binary digit 
+    blocks) with a key from key_bytes(), see encrypt_bytes(). 
+    """
+    if algorithm in CHAIN_BLOCKS:
+        return encrypt_codes_cipher_block_chaining(codes, key, iv, CHAIN_BLOCKS[algorithm])
+    return encrypt_codes_stream_cipher(codes, key)
+
+def decrypt_codes(codes, key, algorithm='CBC', iv=INITIAL_VALUE):
+    """
+    Decrypts 'codes' encrypted by encrypt_codes() with the same key and algorithm. 
+    """
+    if algorithm in CHAIN_BLOCKS:
+        return decrypt_codes_cipher_block_chaining(codes, key, iv, CHAIN_BLOCKS[algorithm])
+    return decrypt_codes_stream_cipher(codes, key)
+
+def encrypt_codes_into(codes, key, out, algorithm='CBC', iv=INITIAL_VALUE):
+    """
+    As encrypt_codes(), but writes the encrypted blocks into the writable buffer "out"
+    (of the same length) instead of returning them. "out" may be "codes" itself. 
+    
+    With numpy the XORs (and the running XOR of the cipher block chaining algorithm) 
+    are done directly in the memory of "out", with no intermediate copies. Without 
+    numpy the result is computed by encrypt_codes() and copied into "out". 
+    """
+    if len(codes) != len(key) or len(codes) != len(out):
+        raise ValueError('The key provided is a different length to the message.')
+    if not USE_NUMPY:
+        out[:] = encrypt_codes(codes, key, algorithm, iv)
+        return
+    o_j = np.asarray(out)
+    np.bitwise_xor(np.asarray(codes), np.frombuffer(key, dtype=np.uint8), out=o_j)
+    if algorithm in CHAIN_BLOCKS and len(o_j):
+        block = CHAIN_BLOCKS[algorithm]
+        whole = block*(len(o_j)//block)
+        blocks = o_j[:whole].reshape(-1, block)
+        np.bitwise_xor.accumulate(blocks, axis=0, out=blocks)
+        if block <= whole < len(o_j):# a last block with fewer codes. 
+            o_j[whole:] ^= o_j[whole-block:len(o_j)-block]
+        row = np.frombuffer(chain_ivs(iv, block, block), dtype=np.uint8)# the iv, as one block. 
+        blocks ^= row# broadcast over every whole block ...
+        o_j[whole:] ^= row[:len(o_j)-whole]# ... and the last, shorter, one. 
+
+def decrypt_codes_into(codes, key, out, algorithm='CBC', iv=INITIAL_VALUE):
+    """
+    As decrypt_codes(), but writes the decrypted blocks into the writable buffer "out"
+    (of the same length) instead of returning them. "out" may be "codes" itself. 
+    
+    For the cipher block chaining algorithms c_{j} [+] c_{j-1} is formed first (numpy 
+    takes care of "out" and "codes" overlapping), then c_{1} [+] iv, and finally the 
+    key is XORed in. 
+    """
+    if len(codes) != len(key) or len(codes) != len(out):
+        raise ValueError('The key provided is a different length to the message.')
+    if not USE_NUMPY:
+        out[:] = decrypt_codes(codes, key, algorithm, iv)
+        return
+    c_j, o_j = np.asarray(codes), np.asarray(out)
+    k_j = np.frombuffer(key, dtype=np.uint8)
+    if algorithm not in CHAIN_BLOCKS or len(o_j) == 0:
+        np.bitwise_xor(c_j, k_j, out=o_j)
+        return
+    block = CHAIN_BLOCKS[algorithm]
+    first = c_j[:block] ^ np.frombuffer(chain_ivs(iv, min(block, len(c_j)), block), dtype=np.uint8)
+    np.bitwise_xor(c_j[block:], c_j[:-block], out=o_j[block:])
+    o_j[:block] = first
+    o_j ^= k_j
+
+def split_segments(n_char, workers, segment_size=None):
+    """
+    Splits a message of "n_char" characters into segments of at most "segment_size" 
+    characters (SEGMENT_SIZE by default), and at least "workers" segments (if the 
+    message is long enough). Returns a list of the (start, end) character of each segment. 
+    """
+    if segment_size == None:
+        segment_size = SEGMENT_SIZE
+    n_segments = max(1, min(max(workers, -(-n_char//segment_size)), n_char))
+    bounds = [(n_char*j)//n_segments for j in range(n_segments+1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def split_blocks(n_char, workers, block=1, segment_size=None):
+    """
+    As split_segments(), but every segment (except the last) is a whole number of blocks 
+    of "block" codes. 
+    """
+    if segment_size == None:
+        segment_size = SEGMENT_SIZE
+    n_blocks = -(-n_char//block)
+    return [(block*start, min(block*end, n_char)) for start, end in split_segments(n_blocks, workers, max(1, segment_size//block))]
+
+def run_segments(task, segments, workers):
+    """
+    Applies "task" to every segment, in a pool of "workers" processes, 
+    and returns the results in order. 
+    """
+    if workers == 1 or len(segments) == 1:
+        return list(map(task, segments))
+    with ProcessPoolExecutor(max_workers=min(workers, len(segments))) as executor:
+        return list(executor.map(task, segments))
+
+def encrypt_segment_stream_cipher(segment):
+    """
+    Encrypts (or decrypts) one segment of a message with the stream cipher. 
+    "segment" = (seed, start, codes, algorithm) where codes are the characters of 
+    the message from position "start" onwards. 
+    
+    The key stream of the segment is generated independently of all other segments. 
+    """
+    seed, start, codes, algorithm = segment
+    key = key_codes_segment(seed, start, len(codes), algorithm)
+    return encrypt_codes_stream_cipher(codes, key)
+
+def encrypt_segment_cipher_block_chaining(segment):
+    """
+    First pass of the parallel cipher block chaining encryption. "segment" = (seed, start, codes, block)
+    where codes are the characters of the message from position "start" onwards, chained in 
+    blocks of "block" codes. 
+    
+    Returns the running XOR of p_{j} [+] k_{j} over the segment alone, i.e. the segment 
+    encrypted as though the block before it were zero. The key stream of the segment is 
+    generated independently of all other segments. 
+    """
+    seed, start, codes, block = segment
+    key = key_codes_segment(seed, start, len(codes))
+    return encrypt_codes_cipher_block_chaining(codes, key, 0, block)
+
+def decrypt_segment_cipher_block_chaining(segment):
+    """
+    Decrypts one segment of a message encrypted with the cipher block chaining algorithm.
+    "segment" = (seed, start, codes, iv, block) where codes are the encrypted characters 
+    from position "start" onwards, chained in blocks of "block" codes, and iv is the 
+    encrypted block before them (or the initial value of the algorithm if start == 0). 
+    
+    The key stream of the segment is generated independently of all other segments. 
+    """
+    seed, start, codes, iv, block = segment
+    key = key_codes_segment(seed, start, len(codes))
+    return decrypt_codes_cipher_block_chaining(codes, key, iv, block)
+
+def encrypt_codes_parallel(codes, seed, algorithm='CBC', workers=None):
+    """
+    Encrypts 'codes' with the key stream starting with "seed" (see key_seed()), split 
+    over "workers" processes (default: one per core). The result is identical to 
+    encrypt_codes(). 
+    
+    The message is split into segments, and every segment generates its own part 
+    of the key stream (see key_codes_segment()). The stream cipher (and the counter
+    algorithm 'CTR') then simply XORs each segment with its key. 
+    
+    The cipher block chaining encryption is a running XOR, and so is done in two passes: 
+    
+    1. Each process computes the running XOR of its own segment, see 
+    encrypt_segment_cipher_block_chaining(). The last block of this is the XOR 
+    of the whole segment, its 'carry'. 
+    
+    2. The block before each segment is the initial value XORed with the carries of 
+    all the segments before it. This is then XORed into every block of the segment. 
+    
+    For 'CBC56' the segments start on whole blocks of 8 codes, and the carries are 
+    whole blocks. 
+    
+    NOTE: as this uses multiprocessing, scripts which call it (or the public functions 
+    with workers > 1) should do so from within an 'if __name__ == "__main__":' block. 
+    """
+    workers = workers or os.cpu_count() or 1
+    if algorithm not in CHAIN_BLOCKS:
+        segments = [(seed, start, bytes(codes[start:end]), algorithm) for start, end in split_segments(len(codes), workers)]
+        return b''.join(run_segments(encrypt_segment_stream_cipher, segments, workers))
+    block = CHAIN_BLOCKS[algorithm]
+    segments = [(seed, start, bytes(codes[start:end]), block) for start, end in split_blocks(len(codes), workers, block)]
+    partial = run_segments(encrypt_segment_cipher_block_chaining, segments, workers)
+    encrypted_codes = []
+    carry = chain_ivs(INITIAL_VALUE, block, block)
+    for part in partial:
+        encrypted_codes.append(encrypt_codes_stream_cipher(part, chain_ivs(carry, len(part), block)))
+        if len(part) >= block:
+            carry = encrypt_codes_stream_cipher(carry, part[-block:])
+    return b''.join(encrypted_codes)
+
+def decrypt_codes_parallel(codes, seed, algorithm='CBC', workers=None):
+    """
+    Decrypts 'codes' encrypted with the key stream starting with "seed", split over
+    "workers" processes (default: one per core). 
+    
+    For the cipher block chaining algorithm each decrypted block only depends on 
+    c_{j}, c_{j-1} and k_{j}, so the encrypted message is split into segments which 
+    overlap by one block, each segment is decrypted in its own process, and the 
+    results are joined back together. The stream cipher is symmetric, and so is 
+    decrypted by encrypt_codes_parallel(). 
+    
+    NOTE: see encrypt_codes_parallel() on calling this from a script. 
+    """
+    if algorithm not in CHAIN_BLOCKS:
+        return encrypt_codes_parallel(codes, seed, algorithm, workers)
+    workers = workers or os.cpu_count() or 1
+    block = CHAIN_BLOCKS[algorithm]
+    segments = []
+    for start, end in split_blocks(len(codes), workers, block):
+        iv = bytes(codes[start-block:start]) if start > 0 else INITIAL_VALUE
+        segments.append((seed, start, bytes(codes[start:end]), iv, block))
+    return b''.join(run_segments(decrypt_segment_cipher_block_chaining, segments, workers))
+
+def encrypt_code_chunks(code_chunks, seed, algorithm='CBC', line_index=None):
+    """
+    A generator which encrypts a message arriving as a sequence of 'codes' (see 
+    message_to_codes()), yielding the encrypted codes of each chunk as it goes. 
+    
+    The key stream and, for the cipher block chaining algorithm, the last encrypted 
+    block are carried from one chunk to the next (see Encryptor()), so the joined 
+    output is identical to encrypting the whole message at once. Only one chunk is 
+    held in memory at a time. 
+    
+    If a LineIndex() is given as "line_index" each chunk is added to it as it goes. 
+    """
+    encryptor = Encryptor(algorithm=algorithm, seed=seed)
+    for codes in code_chunks:
+        encrypted_codes = encryptor.update_codes(codes)
+        if line_index != None:
+            line_index.add(codes, encrypted_codes)
+        yield encrypted_codes
+
+def decrypt_code_chunks(code_chunks, seed, algorithm='CBC'):
+    """
+    A generator which decrypts an encrypted message arriving as a sequence of 'codes',
+    yielding the decrypted codes of each chunk. See encrypt_code_chunks(). 
+    """
+    decryptor = Decryptor(algorithm=algorithm, seed=seed)
+    for codes in code_chunks:
+        yield decryptor.update_codes(codes)
+
+def encrypt_chunks(chunks, seed, algorithm='CBC'):
+    """
+    Encrypts a message arriving as a sequence of "chunks" (strings), returning an iterator 
+    over the encrypted text of each chunk. See encrypt_code_chunks(). 
+    """
+    return map(codes_to_message, encrypt_code_chunks(map(message_to_codes, chunks), seed, algorithm))
+
+def decrypt_chunks(chunks, seed, algorithm='CBC'):
+    """
+    Decrypts an encrypted message arriving as a sequence of "chunks" (strings), returning
+    an iterator over the decrypted text of each chunk. See decrypt_code_chunks(). 
+    """
+    return map(codes_to_message, decrypt_code_chunks(map(message_to_codes, chunks), seed, algorithm))
+
+def encrypt_byte_chunks(byte_chunks, seed, algorithm='CBC'):
+    """
+    A generator which encrypts binary data arriving as a sequence of bytes-like chunks, 
+    yielding the encrypted bytes of each chunk. See encrypt_code_chunks(). 
+    """
+    window, iv, position = seed, INITIAL_VALUE, 0
+    for data in byte_chunks:
+        if algorithm == 'CTR':
+            key = key_bytes_segment(seed, position, len(data), algorithm)
+        else:
+            key, window = next_key_bytes(window, len(data))
+        encrypted_bytes = encrypt_codes(data, key, algorithm, iv)
+        iv = next_iv(iv, encrypted_bytes, algorithm)
+        position += len(data)
+        yield encrypted_bytes
+
+def decrypt_byte_chunks(byte_chunks, seed, algorithm='CBC'):
+    """
+    A generator which decrypts encrypted binary data arriving as a sequence of bytes-like 
+    chunks, yielding the decrypted bytes of each chunk. See encrypt_byte_chunks(). 
+    """
+    window, iv, position = seed, INITIAL_VALUE, 0
+    for data in byte_chunks:
+        if algorithm == 'CTR':
+            key = key_bytes_segment(seed, position, len(data), algorithm)
+        else:
+            key, window = next_key_bytes(window, len(data))
+        decrypted_bytes = decrypt_codes(data, key, algorithm, iv)
+        iv = next_iv(iv, data, algorithm)
+        position += len(data)
+        yield decrypted_bytes
 
 def file_to_message(file_name='encrypt_me.txt'):
     """
     This function simply reads a text file (with name file_name) to a string. 
     """
-    message = str()
     with open(file_name) as fp:
-        for line in fp:
-            message += line
+        message = fp.read()
     return message
 
 def message_to_file(message,save_name='encrypted_file.txt'):
@@ -425,7 +1150,301 @@ def message_to_file(message,save_name='encrypted_file.txt'):
     sf.write(message)
     sf.close()
 
-def encrypt_file(load_file_path=None, save_file_path=None, pin=None,algorithm='CBC'):
+def file_to_chunks(file_name='encrypt_me.txt', chunk_size=None):
+    """
+    A generator which reads a text file (with name file_name) in chunks of 
+    "chunk_size" characters, so that the whole file is never held in memory.
+    """
+    if chunk_size == None:
+        chunk_size = CHUNK_SIZE
+    with open(file_name) as fp:
+        chunk = fp.read(chunk_size)
+        while chunk:
+            yield chunk
+            chunk = fp.read(chunk_size)
+
+def chunks_to_file(chunks, save_name='encrypted_file.txt'):
+    """
+    This function saves a sequence of strings to a text file (with name save_name), 
+    writing each as it arrives. 
+    """
+    with open(save_name,'w+') as sf:
+        for chunk in chunks:
+            sf.write(chunk)
+
+def file_to_byte_chunks(file_name='encrypt_me.bin', chunk_size=None):
+    """
+    A generator which reads a file (with name file_name) as binary data, in chunks 
+    of "chunk_size" bytes. 
+    """
+    if chunk_size == None:
+        chunk_size = CHUNK_SIZE
+    with open(file_name, 'rb') as fp:
+        chunk = fp.read(chunk_size)
+        while chunk:
+            yield chunk
+            chunk = fp.read(chunk_size)
+
+def byte_chunks_to_file(byte_chunks, save_name='encrypted_file.bin'):
+    """
+    This function saves a sequence of bytes-like chunks to a binary file (with name save_name). 
+    """
+    with open(save_name, 'wb') as sf:
+        for chunk in byte_chunks:
+            sf.write(chunk)
+
+def file_to_code_chunks(file_name='encrypt_me.txt', chunk_size=None, offset=0):
+    """
+    A generator which memory maps a UTF-8 text file (with name file_name) and yields 
+    its 'codes' (see utf8_to_codes()) "chunk_size" bytes at a time. The file is read 
+    through the operating system's page cache, and is never decoded to one large string. 
+    
+    Reading starts at byte "offset", which must be the start of a character. 
+    """
+    if chunk_size == None:
+        chunk_size = CHUNK_SIZE
+    with open(file_name, 'rb') as fp:
+        if os.fstat(fp.fileno()).st_size == 0:
+            return# an empty file cannot be memory mapped. 
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            pos, size = offset, len(data)
+            while pos < size:
+                end = min(pos + chunk_size, size)
+                while end < size and 0x80 <= data[end] < 0xC0:# don't split a UTF-8 character.
+                    end += 1
+                if end < size and data[end-1] == 13 and data[end] == 10:# or a '\r\n' line ending.
+                    end += 1
+                yield utf8_to_codes(data[pos:end])
+                pos = end
+
+def code_chunks_to_file(code_chunks, save_name='encrypted_file.txt', max_size=0):
+    """
+    Saves a sequence of 'codes' as a UTF-8 text file (with name save_name). 
+    
+    The file is first sized to "max_size" bytes (an upper limit on its final size, 
+    which must be given), memory mapped, and each chunk is written straight into 
+    its position in the file. The file is truncated to its true size at the end. 
+    """
+    with open(save_name, 'w+b') as sf:
+        if max_size == 0:
+            return
+        sf.truncate(max_size)
+        offset = 0
+        with mmap.mmap(sf.fileno(), max_size) as out:
+            for codes in code_chunks:
+                utf8 = codes_to_utf8(codes)
+                out[offset:offset+len(utf8)] = utf8
+                offset += len(utf8)
+        sf.truncate(offset)
+
+def container_info(file_name):
+    """
+    Returns (algorithm, number of characters) from the header of a packed binary 
+    container file (see code_chunks_to_container()), or None if the file is not one. 
+    """
+    with open(file_name, 'rb') as fp:
+        header = fp.read(CONTAINER_HEADER.size)
+    if len(header) < CONTAINER_HEADER.size or header[:len(CONTAINER_MAGIC)] != CONTAINER_MAGIC:
+        return None
+    magic, version, algorithm_id, n_char = CONTAINER_HEADER.unpack(header)
+    if version != CONTAINER_VERSION:
+        raise ValueError(f'Unsupported container version {version}.')
+    return CONTAINER_ALGORITHMS[algorithm_id], n_char
+
+def code_chunks_to_container(code_chunks, save_name='encrypted_file.pte', algorithm='CBC'):
+    """
+    Saves a sequence of (encrypted) 'codes' as a packed binary container file. 
+    
+    The file is a small header 
+    
+    magic (4 bytes) | version (1 byte) | algorithm (1 byte) | number of characters (8 bytes)
+    
+    followed by the codes packed tightly into bytes (see pack_codes()), so each character 
+    takes 7/8 of a byte, where in a text file the library symbols take 1-3 bytes each. 
+    The number of characters is written into the header once the last chunk is saved. 
+    """
+    with open(save_name, 'wb') as fp:
+        fp.write(CONTAINER_HEADER.pack(CONTAINER_MAGIC, CONTAINER_VERSION, 0, 0))
+        n_char, rest = 0, bytes()
+        for codes in code_chunks:
+            codes = rest + bytes(codes)
+            n_whole = 8*(len(codes)//8)# whole numbers of bytes are written as they arrive. 
+            fp.write(pack_codes(codes[:n_whole]))
+            n_char += n_whole
+            rest = codes[n_whole:]
+        fp.write(pack_codes(rest))
+        n_char += len(rest)
+        algorithm_id = CONTAINER_ALGORITHMS.index(algorithm if algorithm in CONTAINER_ALGORITHMS else 'stream')
+        fp.seek(0)
+        fp.write(CONTAINER_HEADER.pack(CONTAINER_MAGIC, CONTAINER_VERSION, algorithm_id, n_char))
+
+def container_to_code_chunks(file_name, chunk_size=None, start=0):
+    """
+    A generator which reads a packed binary container file and yields its 'codes' 
+    (about) "chunk_size" characters at a time, from character "start" onwards. 
+    No text decoding is involved. 
+    """
+    if chunk_size == None:
+        chunk_size = CHUNK_SIZE
+    algorithm, n_char = container_info(file_name)
+    block = 7*max(1, chunk_size//8)# bytes per chunk, a whole number of groups of 8 codes. 
+    group = start//8
+    n_char -= 8*group
+    skip = start - 8*group# characters of the first group before "start". 
+    with open(file_name, 'rb') as fp:
+        fp.seek(CONTAINER_HEADER.size + 7*group)
+        while n_char > 0:
+            data = fp.read(block)
+            n = min(n_char, 8*len(data)//7)
+            if n == 0:
+                raise ValueError('The container file is shorter than its header says.')
+            yield unpack_codes(data, n)[skip:]
+            skip = 0
+            n_char -= n
+
+def count_characters(data):
+    """
+    Returns the number of characters in the UTF-8 bytes "data", i.e. the number of bytes 
+    which start a character, with '\\r\\n' counted as one character (see utf8_to_codes()). 
+    """
+    return len(data.translate(None, UTF8_CONTINUATION)) - data.count(b'\r\n')
+
+def character_offset(file_name, n_char, from_char=0, from_byte=0):
+    """
+    Returns the byte offset at which character "n_char" (counting from 0) of a UTF-8 
+    text file starts, or the size of the file if it has no more than n_char characters. 
+    
+    The file is memory mapped and its characters are counted a CHUNK_SIZE block at a 
+    time (see count_characters()), then 4096 bytes, then a byte, at a time within the 
+    block which holds the character, so no part of the file is decoded. 
+    
+    If the byte offset "from_byte" of an earlier character "from_char" is known (e.g. from
+    a LineIndex()) the count starts there. 
+    """
+    size = os.path.getsize(file_name)
+    if size == 0:
+        return 0
+    n_char -= from_char
+    with open(file_name, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        pos = from_byte
+        for step in (CHUNK_SIZE, 4096, 1):
+            while pos < size:
+                end = min(pos + step, size)
+                if end < size and data[end-1] == 13 and data[end] == 10:# keeps '\r\n' together. 
+                    end += 1
+                n = count_characters(data[pos:end])
+                if n > n_char:
+                    break
+                n_char -= n
+                pos = end
+        return pos
+
+def count_file_characters(file_name):
+    """
+    Returns the number of characters in a UTF-8 text file, counted CHUNK_SIZE bytes 
+    at a time without decoding the file (see count_characters()). 
+    """
+    n_char, carry = 0, bytes()
+    with open(file_name, 'rb') as fp:
+        data = fp.read(CHUNK_SIZE)
+        while data:
+            data = carry + data
+            carry = data[-1:] if data.endswith(b'\r') else bytes()# may be the start of a '\r\n'. 
+            n_char += count_characters(data[:len(data)-len(carry)])
+            data = fp.read(CHUNK_SIZE)
+    return n_char + len(carry)
+
+def file_tail_codes(file_name, n_char):
+    """
+    Returns the 'codes' of the last "n_char" characters of a text file, or of a packed 
+    binary container file, reading only the end of the file. 
+    """
+    info = container_info(file_name)
+    if info != None:
+        return file_codes_range(file_name, max(0, info[1] - n_char), n_char)
+    size = os.path.getsize(file_name)
+    with open(file_name, 'rb') as fp:
+        fp.seek(max(0, size - MAX_WIDTH*(n_char+1)))
+        data = fp.read()
+    start = 0
+    while start < len(data) and data[start] & 0xC0 == 0x80:# drops the first character, which may be cut short. 
+        start += 1
+    codes = utf8_to_codes(data[start:])
+    return codes[len(codes)-n_char:] if n_char else bytes()
+
+def move_file_tail(fp, src, dst):
+    """
+    Moves the end of the open file "fp", from byte "src" onwards, to start at byte "dst"
+    instead (truncating or extending the file), CHUNK_SIZE bytes at a time. 
+    """
+    size = fp.seek(0, os.SEEK_END)
+    if dst < src:
+        pos = src
+        while pos < size:# front to back, so nothing is overwritten before it is moved. 
+            fp.seek(pos)
+            data = fp.read(CHUNK_SIZE)
+            fp.seek(pos - src + dst)
+            fp.write(data)
+            pos += len(data)
+        fp.truncate(size - src + dst)
+    else:
+        end = size
+        while end > src:# back to front. 
+            start = max(src, end - CHUNK_SIZE)
+            fp.seek(start)
+            data = fp.read(end - start)
+            fp.seek(start - src + dst)
+            fp.write(data)
+            end = start
+
+def file_codes_range(file_name, start, n_char):
+    """
+    Returns the 'codes' of characters start, start+1, ..., start+n_char-1 of a text file,
+    or of a packed binary container file (see code_chunks_to_container()), without 
+    reading the rest of the file. 
+    
+    A container holds every character in 7 binary digits, so the characters are found 
+    directly: every group of 8 codes fills 7 bytes. A text file is scanned to find the 
+    byte offset of character "start" (see character_offset()). 
+    """
+    info = container_info(file_name)
+    if info != None:
+        n_char = min(n_char, info[1] - start)
+        if n_char <= 0:
+            return bytes()
+        group = start//8
+        with open(file_name, 'rb') as fp:
+            fp.seek(CONTAINER_HEADER.size + 7*group)
+            n_group = start + n_char - 8*group
+            data = fp.read((7*n_group + 7)//8)
+        return unpack_codes(data, n_group)[start-8*group:]
+    with open(file_name, 'rb') as fp:
+        fp.seek(character_offset(file_name, start))
+        data = fp.read(MAX_WIDTH*(n_char+1))
+    if len(data) == MAX_WIDTH*(n_char+1):
+        end = len(data) - 1
+        while data[end] & 0xC0 == 0x80:# drops the last character, which may be cut short. 
+            end -= 1
+        data = data[:end]
+    return utf8_to_codes(data)[:n_char]
+
+def save_line_index(line_index, file_name):
+    """
+    Saves "line_index" (see LineIndex()) as the index of the encrypted file file_name, to 
+    file_name + '.idx'. If line_index is None an index left there by an earlier encryption, 
+    which would no longer match the file, is removed instead. Only a line index file (one 
+    starting with INDEX_MAGIC) is removed, any other file of that name is left alone. 
+    """
+    index_path = file_name + '.idx'
+    if line_index != None:
+        line_index.save(index_path)
+    elif os.path.isfile(index_path):
+        with open(index_path, 'rb') as fp:
+            is_index = fp.read(len(INDEX_MAGIC)) == INDEX_MAGIC
+        if is_index:
+            os.remove(index_path)
+
+def encrypt_file(load_file_path=None, save_file_path=None, pin=None,algorithm='CBC', workers=1, streaming=False, chunk_size=None, memory_map=False, binary=False, container=False, index_every=None):
     """
     This funciton encrypts a text file. It then saves an ecrypted version of the file. 
     
@@ -439,49 +1458,98 @@ def encrypt_file(load_file_path=None, save_file_path=None, pin=None,algorithm='C
     pin = the encryption pin. Can be a numeric pin or alpha-numeric password.
     save_file_path = the location where the encrypted text file will be saved.
     
+    If workers > 1 (or None, one per core) the file is encrypted in parallel
+    by that many processes, see encrypt_codes_parallel(). 
+    
+    If streaming is set True the file is read, encrypted and saved "chunk_size" characters
+    at a time (see encrypt_code_chunks()), so memory use does not grow with the size of the file.
+    The encrypted file is identical. Streaming is done in a single process. 
+    
+    If memory_map is set True the file is memory mapped and read as UTF-8 bytes, and the 
+    encrypted file is written straight into a memory mapped output file, see 
+    file_to_code_chunks() and code_chunks_to_file(). 
+    
+    If binary is set True the file is read and encrypted as raw binary data, every byte 
+    of it, rather than as text (see encrypt_bytes()), and the encrypted file is binary. 
+    With streaming or memory_map it is read "chunk_size" bytes at a time. Binary files 
+    are always encrypted in a single process. 
+    
+    If container is set True the encrypted file is saved in the packed binary container 
+    format (see code_chunks_to_container()) rather than as text. It is about a third 
+    the size and much faster to read and write. decrypt_file() recognises it by itself. 
+    
+    If index_every = N is given a line index is saved next to the encrypted file, as 
+    save_file_path + '.idx' (see LineIndex()), which read_encrypted_lines() uses to 
+    decrypt only the lines it is asked for. An index left from an earlier encryption 
+    to the same path is removed (see save_line_index()). 
+    
     """
-    if load_file_path != None:
-        message = file_to_message(load_file_path)
-        binary_message = message_to_binary(message)
-    else:
+    if load_file_path == None:
         print()
         load_file_path = input('Path to file to be encrypted: ')
         print()
+    if binary and container:
+        raise ValueError('Binary files cannot be saved in the container format, their encrypted bytes are already packed.')
+    if binary and index_every:
+        raise ValueError('Binary files have no lines to index.')
+    line_index = LineIndex(index_every, container) if index_every else None
+    if not (streaming or memory_map or binary):
         message = file_to_message(load_file_path)
-        binary_message = message_to_binary(message)
+        codes = message_to_codes(message)
         
-    if pin != None:
-        pin = str(pin)
-        if pin.isnumeric():
-            key = key_from_pin(int(pin),len(binary_message))
-        else:
-            key = key_from_password(pin,len(binary_message))
-    else:
+    if pin == None:
         print()
         pin = input('Encryption Pin: ')
         print()
-        if pin.isnumeric():
-            key = key_from_pin(int(pin),len(binary_message))
+    
+    if save_file_path == None and (streaming or memory_map or binary):
+        print()
+        save_file_path = input('Name and path for encrypted file: ')
+        print()
+    if binary:
+        if streaming or memory_map:
+            encrypted_chunks = encrypt_byte_chunks(file_to_byte_chunks(load_file_path, chunk_size), key_seed(pin), algorithm)
+        else:
+            with open(load_file_path, 'rb') as fp:
+                encrypted_chunks = [encrypt_bytes(fp.read(), pin, algorithm)]
+        byte_chunks_to_file(encrypted_chunks, save_file_path)
+        save_line_index(None, save_file_path)
+        return
+    if streaming or memory_map:
+        if memory_map:
+            code_chunks = file_to_code_chunks(load_file_path, chunk_size)
+        else:
+            code_chunks = map(message_to_codes, file_to_chunks(load_file_path, chunk_size))
+        encrypted_codes = encrypt_code_chunks(code_chunks, key_seed(pin), algorithm, line_index)
+        if container:
+            code_chunks_to_container(encrypted_codes, save_file_path, algorithm)
+        elif memory_map:
+            code_chunks_to_file(encrypted_codes, save_file_path, MAX_WIDTH*os.path.getsize(load_file_path))
         else:
-            key = key_from_password(pin,len(binary_message))
+            chunks_to_file(map(codes_to_message, encrypted_codes), save_file_path)
+        save_line_index(line_index, save_file_path)
+        return
     
-    if algorithm == 'CBC':
-        encrypted_binary = encrypt_binary_cipher_block_chaining(binary_message, key)
+    if workers != 1:
+        encrypted_codes = encrypt_codes_parallel(codes, key_seed(pin), algorithm, workers)
     else:
-        encrypted_binary = encrypt_binary_stream_cipher(binary_message, key)
+        key = key_codes(pin, len(codes), algorithm)
+        encrypted_codes = encrypt_codes(codes, key, algorithm)
     
-    encrypted_message = binary_to_message(encrypted_binary)
-    
-    if save_file_path != None:
-        message_to_file(encrypted_message,save_file_path)
-    else:
+    if save_file_path == None:
         print()
         save_file_path = input('Name and path for encrypted file: ')
         print()
-        message_to_file(encrypted_message,save_file_path)
+    if container:
+        code_chunks_to_container([encrypted_codes], save_file_path, algorithm)
+    else:
+        message_to_file(codes_to_message(encrypted_codes),save_file_path)
+    if line_index != None:
+        line_index.add(codes, encrypted_codes)
+    save_line_index(line_index, save_file_path)
     
 
-def decrypt_file(load_file_path=None, save_file_path=None, pin=None,algorithm='CBC'):
+def decrypt_file(load_file_path=None, save_file_path=None, pin=None,algorithm='CBC', workers=1, streaming=False, chunk_size=None, memory_map=False, binary=False):
     """
     This funciton decrypts an encrypted text file. It then saves the decrypted version of the file. 
     
@@ -495,39 +1563,75 @@ def decrypt_file(load_file_path=None, save_file_path=None, pin=None,algorithm='C
     pin = the encryption pin. Can be a numeric pin or alpha-numeric password.
     save_file_path = the location where the decrypted text file will be saved.
     
+    If workers > 1 (or None, one per core) the file is decrypted in parallel
+    by that many processes, see decrypt_codes_parallel(). 
+    
+    If streaming is set True the file is read, decrypted and saved "chunk_size" characters
+    at a time (see decrypt_chunks()), so memory use does not grow with the size of the file.
+    
+    If memory_map is set True the file is memory mapped and read as UTF-8 bytes, and the 
+    decrypted file is written straight into a memory mapped output file. 
+    
+    If binary is set True the file is decrypted as raw binary data (see decrypt_bytes()), 
+    as saved by encrypt_file(binary=True). 
+    
+    Packed binary container files (see encrypt_file(container=True)) are recognised by 
+    their header, and the algorithm recorded in the header is used in place of "algorithm". 
+    
     """
     
-    if load_file_path != None:
-        encrypted_message = file_to_message(load_file_path)
-        encrypted_binary = message_to_binary(encrypted_message)
-    else:
+    if load_file_path == None:
         print()
         load_file_path = input('Path to file to be decrypted: ')
         print()
+    info = container_info(load_file_path) if not binary else None
+    if info != None:
+        algorithm, n_char = info
+        if not (streaming or memory_map):
+            codes = b''.join(container_to_code_chunks(load_file_path))
+    elif not (streaming or memory_map or binary):
         encrypted_message = file_to_message(load_file_path)
-        encrypted_binary = message_to_binary(encrypted_message)
+        codes = message_to_codes(encrypted_message)
         
-    if pin != None:
-        pin = str(pin)
-        if pin.isnumeric():
-            key = key_from_pin(int(pin),len(encrypted_binary))
-        else:
-            key = key_from_password(pin,len(encrypted_binary))
-    else:
+    if pin == None:
         print()
         pin = input('Decryption Pin: ')
         print()
-        if pin.isnumeric():
-            key = key_from_pin(int(pin),len(encrypted_binary))
-        else:
-            key = key_from_password(pin,len(encrypted_binary))
     
-    if algorithm == 'CBC':
-        decrypted_binary = decrypt_binary_cipher_block_chaining(encrypted_binary, key)
+    if save_file_path == None and (streaming or memory_map or binary):
+        print()
+        save_file_path = input('Name and path for decrypted file: ')
+        print()
+    if binary:
+        if streaming or memory_map:
+            decrypted_chunks = decrypt_byte_chunks(file_to_byte_chunks(load_file_path, chunk_size), key_seed(pin), algorithm)
+        else:
+            with open(load_file_path, 'rb') as fp:
+                decrypted_chunks = [decrypt_bytes(fp.read(), pin, algorithm)]
+        byte_chunks_to_file(decrypted_chunks, save_file_path)
+        return
+    if info != None and (streaming or memory_map):
+        decrypted_codes = decrypt_code_chunks(container_to_code_chunks(load_file_path, chunk_size), key_seed(pin), algorithm)
+        if memory_map:
+            code_chunks_to_file(decrypted_codes, save_file_path, MAX_WIDTH*n_char)
+        else:
+            chunks_to_file(map(codes_to_message, decrypted_codes), save_file_path)
+        return
+    if memory_map:
+        decrypted_codes = decrypt_code_chunks(file_to_code_chunks(load_file_path, chunk_size), key_seed(pin), algorithm)
+        code_chunks_to_file(decrypted_codes, save_file_path, MAX_WIDTH*os.path.getsize(load_file_path))
+        return
+    if streaming:
+        decrypted_chunks = decrypt_chunks(file_to_chunks(load_file_path, chunk_size), key_seed(pin), algorithm)
+        chunks_to_file(decrypted_chunks, save_file_path)
+        return
+    
+    if workers != 1:
+        decrypted_codes = decrypt_codes_parallel(codes, key_seed(pin), algorithm, workers)
     else:
-        decrypted_binary = decrypt_binary_stream_cipher(encrypted_binary, key)
-    
-    message = binary_to_message(decrypted_binary)
+        key = key_codes(pin, len(codes), algorithm)
+        decrypted_codes = decrypt_codes(codes, key, algorithm)
+    message = codes_to_message(decrypted_codes)
     if save_file_path != None:
         message_to_file(message,save_file_path)
     else:
@@ -537,7 +1641,233 @@ def decrypt_file(load_file_path=None, save_file_path=None, pin=None,algorithm='C
         message_to_file(message,save_file_path)
 
 
-def encrypt_message(message=None, pin=None, algorithm='CBC', save_encrypted_message = False, save_file_path = 'encrypted_message.txt'):
+def decrypt_range(load_file_path, pin, start, length, algorithm='CBC'):
+    """
+    Decrypts only the characters start, start+1, ..., start+length-1 of a file encrypted 
+    by encrypt_file(), and returns them as a string. 
+    
+    The key stream is generated from position "start" onwards (see key_codes_segment()), 
+    so none of the file before it is decrypted. The stream ciphers need nothing else, and 
+    the cipher block chaining algorithms only need the encrypted block before "start" 
+    (see next_iv()). For a packed binary container (see encrypt_file(container=True)) the 
+    characters are read straight from their position, and the algorithm in its header is 
+    used. A text file is first scanned (not decrypted) to find where character "start" is. 
+    """
+    if start < 0 or length < 0:
+        raise ValueError('decrypt_range() needs a start and a length of at least 0.')
+    info = container_info(load_file_path)
+    if info != None:
+        algorithm = info[0]
+    block = CHAIN_BLOCKS.get(algorithm, 0)
+    first = max(0, start - block)
+    codes = file_codes_range(load_file_path, first, length + start - first)
+    previous, codes = codes[:start-first], codes[start-first:]
+    key = key_codes_segment(key_seed(pin), start, len(codes), algorithm)
+    iv = next_iv(INITIAL_VALUE, previous, algorithm)
+    return codes_to_message(decrypt_codes(codes, key, algorithm, iv))
+
+def iter_decrypted_lines(load_file_path, pin, algorithm='CBC', first=0, chunk_size=2**16):
+    """
+    A generator which decrypts a file encrypted by encrypt_file() and yields its lines 
+    one at a time (as strings, without their line endings), from line "first" onwards. 
+    
+    The file is read and decrypted "chunk_size" bytes at a time by a Decryptor(), which 
+    carries the key stream and the last encrypted block from one chunk to the next, so 
+    lines can be processed as soon as they are decrypted, and the generator stopped early. 
+    Only one chunk (and the line it ends in) is held in memory. 
+    
+    If first > 0 and the file has a line index (see encrypt_file(index_every=N) and 
+    LineIndex()) the decryption starts at the nearest indexed line before "first", with 
+    the key stream jumped straight to it, so at most N-1 earlier lines are decrypted. 
+    An index which no longer matches the file is ignored (see LineIndex.for_file()). 
+    As with decrypt_file() a packed binary container is recognised by its header. 
+    """
+    info = container_info(load_file_path)
+    if info != None:
+        algorithm = info[0]
+    index = LineIndex.for_file(load_file_path) if first > 0 else None
+    if index == None:
+        index = LineIndex(1, info != None)# just the start of the file. 
+    k = min(first//index.every, len(index.entries)-1)
+    start, offset, previous = index.entries[k]
+    line = k*index.every
+    decryptor = Decryptor(pin, algorithm, start=start, iv=next_iv(INITIAL_VALUE, previous, algorithm))
+    if info != None:
+        code_chunks = container_to_code_chunks(load_file_path, chunk_size, start)
+    else:
+        code_chunks = file_to_code_chunks(load_file_path, chunk_size, offset)
+    pending = []# the pieces of a line which has not ended yet, joined once it does. 
+    for codes in code_chunks:
+        pieces = codes_to_message(decryptor.update_codes(codes)).split('\n')
+        if len(pieces) > 1:
+            pieces[0] = ''.join(pending + pieces[:1])
+            pending = []
+            for text_line in pieces[:-1]:
+                if line >= first:
+                    yield text_line
+                line += 1
+        pending.append(pieces[-1])
+    decryptor.finalize()
+    pending = ''.join(pending)
+    if pending and line >= first:
+        yield pending
+
+def read_encrypted_lines(load_file_path, pin, first, count, algorithm='CBC', chunk_size=2**16):
+    """
+    Decrypts lines first, first+1, ..., first+count-1 (counting from 0) of a file encrypted
+    by encrypt_file(), and returns them as a list of strings (without their line endings). 
+    
+    If the file has a line index (see encrypt_file(index_every=N) and LineIndex()) the 
+    decryption starts at the nearest indexed line before "first", so at most N-1 lines 
+    before the requested lines are decrypted. Without an index the file is decrypted 
+    from its start until the lines are found. See iter_decrypted_lines(). 
+    """
+    return list(islice(iter_decrypted_lines(load_file_path, pin, algorithm, first, chunk_size), count))
+
+def append_encrypted(file_path, pin, text, algorithm='CBC'):
+    """
+    Encrypts "text" and appends it to the end of a file encrypted by encrypt_file(), 
+    without decrypting or re-encrypting the file. The result is identical to encrypting 
+    the whole of the (decrypted) file followed by "text". 
+    
+    Only the end of the file is read: the number of characters in it fixes the position 
+    in the key stream, which is jumped straight to (see Encryptor()), and the last encrypted 
+    block is the block before the new text. A packed binary container records its number 
+    of characters (and its algorithm) in its header, and a file with a line index (see 
+    LineIndex()) in the index, which is updated too. An index which no longer matches 
+    the file (see LineIndex.for_file()) is ignored and left alone. 
+    
+    NOTE: otherwise a text file is scanned to count its characters (though not decrypted), 
+    so each append to a text file without an index costs time in proportion to the whole 
+    file. Encrypt files which are appended to often with index_every (see encrypt_file()), 
+    or as a container, to make each append cost only the new text. 
+    
+    If the file does not exist it is created. 
+    """
+    info = container_info(file_path) if os.path.exists(file_path) else None
+    index_path = file_path + '.idx'
+    index = LineIndex.for_file(file_path)
+    if info != None:
+        algorithm, n_char = info
+    elif index != None:
+        n_char = index.n_char
+    elif os.path.exists(file_path):
+        n_char = count_file_characters(file_path)
+    else:
+        n_char = 0
+    tail = file_tail_codes(file_path, min(n_char, 9)) if n_char else bytes()
+    seed = key_seed(pin)
+    encryptor = Encryptor(algorithm=algorithm, seed=seed, start=n_char, iv=next_iv(INITIAL_VALUE, tail, algorithm))
+    codes = message_to_codes(text)
+    encrypted_codes = encryptor.update_codes(codes)
+    if info != None:
+        group = n_char//8
+        partial = tail[len(tail)-(n_char-8*group):]# the codes of a last group with fewer than 8. 
+        with open(file_path, 'r+b') as fp:
+            fp.seek(CONTAINER_HEADER.size + 7*group)
+            fp.write(pack_codes(partial + encrypted_codes))
+            fp.seek(0)
+            fp.write(CONTAINER_HEADER.pack(CONTAINER_MAGIC, CONTAINER_VERSION, CONTAINER_ALGORITHMS.index(algorithm), n_char + len(codes)))
+    else:
+        n_byte = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+        with open(file_path, 'ab') as fp:
+            fp.write(codes_to_utf8(encrypted_codes))
+    if index != None:
+        last = None
+        if n_char:
+            key = key_codes_segment(seed, n_char-1, 1, algorithm)
+            last = decrypt_codes(tail[-1:], key, algorithm, next_iv(INITIAL_VALUE, tail[:-1], algorithm))[0]
+        index.resume(tail, last, 0 if info != None else n_byte, info != None)
+        index.add(codes, encrypted_codes)
+        index.save(index_path)
+
+def patch_encrypted(file_path, pin, offset, new_text, algorithm='CBC'):
+    """
+    Replaces the characters of an encrypted file from character "offset" onwards with 
+    "new_text" (the same number of characters), encrypting only the new text. 
+    
+    With the stream cipher (and the counter algorithm 'CTR') each encrypted character only 
+    depends on its own character and its position in the key stream, so only the key 
+    stream at "offset" is generated (see key_codes_segment()) and only the replaced 
+    characters are rewritten. The cipher block chaining algorithms chain every character 
+    to all of those before it, so cannot be patched. As everywhere else "algorithm" 
+    defaults to 'CBC', so the algorithm of a stream cipher text file must be given 
+    (a container records its own). 
+    
+    A packed binary container is patched in place. In a text file the new encrypted 
+    characters are written in place if they take the same number of bytes in UTF-8 as 
+    the old ones, otherwise the rest of the file is moved along after them. A line index 
+    (see LineIndex()) is updated, and is rebuilt (by decrypting the file) if the patch 
+    moves any line endings. An index which no longer matches the file is left alone. 
+    """
+    if offset < 0:
+        raise ValueError('patch_encrypted() needs an offset of at least 0.')
+    info = container_info(file_path)
+    if info != None:
+        algorithm = info[0]
+    if algorithm in CHAIN_BLOCKS:
+        raise ValueError(f'Files encrypted with the {algorithm} algorithm cannot be patched, only stream cipher (or CTR) files.')
+    index_path = file_path + '.idx'
+    index = LineIndex.for_file(file_path)
+    codes = message_to_codes(new_text)
+    n_char = len(codes)
+    first = max(0, offset - 8)# the window read also holds the 8 characters either side (see LineIndex()). 
+    last = offset + n_char + 8
+    if info != None:
+        window = file_codes_range(file_path, first, last - first)
+    else:
+        anchor = (0, 0)
+        if index != None:
+            anchor = max(entry[:2] for entry in index.entries if entry[0] <= first)
+        byte_first = character_offset(file_path, first, *anchor)
+        byte_start = character_offset(file_path, offset, first, byte_first)
+        byte_end = character_offset(file_path, offset + n_char, offset, byte_start)
+        byte_last = character_offset(file_path, last, offset + n_char, byte_end)
+        with open(file_path, 'rb') as fp:
+            fp.seek(byte_first)
+            window = utf8_to_codes(fp.read(byte_last - byte_first))
+    old_codes = window[offset-first:offset-first+n_char]
+    if len(old_codes) != n_char:
+        raise ValueError('The new text runs past the end of the encrypted file.')
+    key = key_codes_segment(key_seed(pin), offset, n_char, algorithm)
+    encrypted_codes = encrypt_codes(codes, key, algorithm)
+    if info != None:
+        group, end_group = offset//8, min(info[1], -(-(offset + n_char)//8)*8)
+        groups = file_codes_range(file_path, 8*group, end_group - 8*group)
+        groups = groups[:offset-8*group] + encrypted_codes + groups[offset+n_char-8*group:]
+        with open(file_path, 'r+b') as fp:
+            fp.seek(CONTAINER_HEADER.size + 7*group)
+            fp.write(pack_codes(groups))
+    else:
+        utf8 = codes_to_utf8(encrypted_codes)
+        with open(file_path, 'r+b') as fp:
+            if len(utf8) != byte_end - byte_start:
+                move_file_tail(fp, byte_end, byte_start + len(utf8))
+            fp.seek(byte_start)
+            fp.write(utf8)
+    if index == None:
+        return
+    line_endings = bytes(int(num == NEWLINE_CODE) for num in range(256))# bytes.translate() table. 
+    if decrypt_codes(old_codes, key, algorithm).translate(line_endings) != codes.translate(line_endings):
+        LineIndex.build(file_path, pin, algorithm, index.every).save(index_path)
+        return
+    window = window[:offset-first] + encrypted_codes + window[offset-first+n_char:]
+    delta = 0 if info != None else len(utf8) - (byte_end - byte_start)
+    entries = []
+    for start, byte, previous in index.entries:
+        if offset < start < offset + n_char and info == None:
+            byte = byte_start + sum(encrypted_codes[:start-offset].translate(CODE_WIDTHS))
+        elif start >= offset + n_char:
+            byte += delta
+        if offset < start < last:
+            previous = (bytes([INITIAL_VALUE])*8 + window[:start-first])[-8:]
+        entries.append((start, byte, previous))
+    index.entries = entries
+    index.n_byte += delta
+    index.previous = next_iv(INITIAL_VALUE, file_tail_codes(file_path, min(index.n_char, 8)), 'CBC56')
+    index.save(index_path)
+
+def encrypt_message(message=None, pin=None, algorithm='CBC', save_encrypted_message = False, save_file_path = 'encrypted_message.txt', workers=1):
     """
     This funciton encrypts a 'message', not taken from a file. 
     It can then either print or save an ecrypted version of this message.
@@ -557,43 +1887,36 @@ def encrypt_message(message=None, pin=None, algorithm='CBC', save_encrypted_mess
     I strongly recommend saving the encrypted message. This is because errors
     can propogate when copying and pasting from the terminal. 
     
+    If workers > 1 (or None, one per core) the message is encrypted in parallel
+    by that many processes, see encrypt_codes_parallel(). 
+    
     """
     
     if message != None:
-        binary_message = message_to_binary(message)
+        codes = message_to_codes(message)
     else:
         print('Message to be encrypted: IMPORTANT: press enter then control+D (mac) or control+Z (windows) when done. ')
         message = sys.stdin.read()
         print()
-        binary_message = message_to_binary(message)
+        codes = message_to_codes(message)
         
-    if pin != None:
-        pin = str(pin)
-        if pin.isnumeric():
-            key = key_from_pin(int(pin),len(binary_message))
-        else:
-            key = key_from_password(pin,len(binary_message))
-    else:
+    if pin == None:
         print()
         pin = input('Encryption Pin: ')
         print()
-        if pin.isnumeric():
-            key = key_from_pin(int(pin),len(binary_message))
-        else:
-            key = key_from_password(pin,len(binary_message))
     
-    if algorithm == 'CBC':
-        encrypted_binary = encrypt_binary_cipher_block_chaining(binary_message, key)
+    if workers != 1:
+        encrypted_codes = encrypt_codes_parallel(codes, key_seed(pin), algorithm, workers)
     else:
-        encrypted_binary = encrypt_binary_stream_cipher(binary_message, key)
-    
-    encrypted_message = binary_to_message(encrypted_binary)
+        key = key_codes(pin, len(codes), algorithm)
+        encrypted_codes = encrypt_codes(codes, key, algorithm)
+    encrypted_message = codes_to_message(encrypted_codes)
     
     if save_encrypted_message:
         message_to_file(encrypted_message,save_file_path)
     return encrypted_message
 
-def decrypt_message(message=None, pin=None, algorithm='CBC', save_decrypted_message = False, save_file_path = 'decrypted_message.txt'):
+def decrypt_message(message=None, pin=None, algorithm='CBC', save_decrypted_message = False, save_file_path = 'decrypted_message.txt', workers=1):
     """    
     This funciton decrypts a 'message', not taken from a file. 
     It can then either print or save an derypted version of this message.
@@ -610,42 +1933,658 @@ def decrypt_message(message=None, pin=None, algorithm='CBC', save_decrypted_mess
     if save_decrypted_message is set True then the encrypted message will be 
     saved as a text file, at location save_file_path. 
     
+    If workers > 1 (or None, one per core) the message is decrypted in parallel
+    by that many processes, see decrypt_codes_parallel(). 
+    
     """
     
     if message != None:
-        encrypted_binary = message_to_binary(message)
+        codes = message_to_codes(message)
     else:
         print('Message to be decrypted: IMPORTANT: press enter then control+D (mac) or control+Z (windows) when done. ')
         message = sys.stdin.read()
         print()
-        encrypted_binary = message_to_binary(message)
+        codes = message_to_codes(message)
         
-    if pin != None:
-        pin = str(pin)
-        if pin.isnumeric():
-            key = key_from_pin(int(pin),len(encrypted_binary))
-        else:
-            key = key_from_password(pin,len(encrypted_binary))
-    else:
+    if pin == None:
         print()
         pin = input('Encryption Pin: ')
         print()
-        if pin.isnumeric():
-            key = key_from_pin(int(pin),len(encrypted_binary))
-        else:
-            key = key_from_password(pin,len(encrypted_binary))
     
-    if algorithm == 'CBC':
-        decrypted_binary = decrypt_binary_cipher_block_chaining(encrypted_binary, key)
+    if workers != 1:
+        decrypted_codes = decrypt_codes_parallel(codes, key_seed(pin), algorithm, workers)
     else:
-        decrypted_binary = decrypt_binary_stream_cipher(encrypted_binary, key)
-    
-    decrypted_message = binary_to_message(decrypted_binary)
+        key = key_codes(pin, len(codes), algorithm)
+        decrypted_codes = decrypt_codes(codes, key, algorithm)
+    decrypted_message = codes_to_message(decrypted_codes)
     
     if save_decrypted_message:
         message_to_file(decrypted_message,save_file_path)
     return decrypted_message
+
+def encrypt_bytes(data, pin=None, algorithm='CBC'):
+    """
+    This function encrypts binary data: any bytes-like object (bytes, bytearray, 
+    memoryview, array, ...), returning the encrypted bytes. 
+    
+    Every byte is one block of 8 binary digits, encrypted with the same key stream
+    (see key_bytes()) and algorithms as text. Unlike text, where characters outside 
+    the library are dropped, every byte value is encrypted, so binary data (or text 
+    in any language, as UTF-8) does not need to be base64 encoded first. 
+    """
+    if pin == None:
+        print()
+        pin = input('Encryption Pin: ')
+        print()
+    data = memoryview(data).cast('B')
+    return encrypt_codes(data, key_bytes(pin, len(data), algorithm), algorithm)
+
+def decrypt_bytes(data, pin=None, algorithm='CBC'):
+    """
+    This function decrypts binary data encrypted by encrypt_bytes(), 
+    returning the decrypted bytes. 
+    """
+    if pin == None:
+        print()
+        pin = input('Decryption Pin: ')
+        print()
+    data = memoryview(data).cast('B')
+    return decrypt_codes(data, key_bytes(pin, len(data), algorithm), algorithm)
+
+def buffers_into(source, destination):
+    """
+    Returns byte views of "source" and of the start of the writable "destination" 
+    (or of "source" itself if destination is None), for encrypt_into() and decrypt_into(). 
+    """
+    source = memoryview(source).cast('B')
+    if destination is None:# 'is', as numpy arrays compare elementwise with ==.
+        destination = source
+    else:
+        destination = memoryview(destination).cast('B')
+    if destination.readonly:
+        raise TypeError('The destination buffer must be writable.')
+    if len(destination) < len(source):
+        raise ValueError('The destination buffer is smaller than the source.')
+    return source, destination[:len(source)]
+
+def encrypt_into(source, destination=None, pin=None, algorithm='CBC'):
+    """
+    Encrypts the binary data in the buffer "source" into the writable buffer "destination", 
+    or in place if destination is None. Returns the number of bytes written. 
+    
+    Any buffer-protocol objects can be used (bytearray, memoryview, array, numpy arrays, 
+    mmap, ...). The result is identical to encrypt_bytes(), but no new buffers or strings 
+    are allocated for it, see encrypt_codes_into(). 
+    """
+    if pin == None:
+        print()
+        pin = input('Encryption Pin: ')
+        print()
+    source, destination = buffers_into(source, destination)
+    encrypt_codes_into(source, key_bytes(pin, len(source), algorithm), destination, algorithm)
+    return len(source)
+
+def decrypt_into(source, destination=None, pin=None, algorithm='CBC'):
+    """
+    Decrypts the encrypted binary data in the buffer "source" into the writable buffer 
+    "destination", or in place if destination is None. Returns the number of bytes written. 
+    See encrypt_into(). 
+    """
+    if pin == None:
+        print()
+        pin = input('Decryption Pin: ')
+        print()
+    source, destination = buffers_into(source, destination)
+    decrypt_codes_into(source, key_bytes(pin, len(source), algorithm), destination, algorithm)
+    return len(source)
  
+class Cipher:
+    """
+    A reusable encryptor/decryptor for a single pin and algorithm. 
+    
+    The public functions above re-derive the key stream from the pin on every call. 
+    A Cipher derives the seed of the key stream once, and keeps the key stream it 
+    has generated so far, extending it only when a longer message arrives. Encrypting 
+    many short messages under the same pin then costs little more than the XORs. 
+    
+    e.g. 
+    
+    cipher = textencryptor.Cipher(pin=123456)
+    encrypted_message = cipher.encrypt('A secret message.')
+    cipher.decrypt(encrypted_message)
+    
+    Messages encrypted by a Cipher are identical to those from encrypt_message() 
+    (and files to those from encrypt_file()) with the same pin and algorithm. 
+    """
+    __slots__ = ('algorithm', 'seed', 'key', 'window')
+    
+    def __init__(self, pin, algorithm='CBC'):
+        if pin == None:
+            raise ValueError('A Cipher needs a pin.')
+        self.algorithm = algorithm
+        self.seed = key_seed(pin)
+        if not self.seed:
+            raise ValueError('The pin must contain at least one library character.')
+        self.key = b''# the start of the key stream, as codes.
+        self.window = self.seed# the key stream at the end of self.key (see next_key_codes()).
+    
+    def key_codes(self, n_char):
+        """
+        Returns the key stream for a message of "n_char" characters as 'codes'. The stored
+        key stream is at least doubled whenever it is extended, so that a run of slowly 
+        growing messages does not extend it every time. 
+        """
+        if n_char > len(self.key):
+            n_new = max(n_char, 2*len(self.key)) - len(self.key)
+            if self.algorithm == 'CTR':
+                extra = key_codes_segment(self.seed, len(self.key), n_new, self.algorithm)
+            else:
+                extra, self.window = next_key_codes(self.window, n_new)
+            self.key += extra
+        return memoryview(self.key)[:n_char]
+    
+    def encrypt_buffer(self, codes):
+        """
+        Encrypts a buffer of 'codes' (see message_to_codes()), returning the encrypted codes.
+        """
+        return encrypt_codes(codes, self.key_codes(len(codes)), self.algorithm)
+    
+    def decrypt_buffer(self, codes):
+        """
+        Decrypts a buffer of encrypted 'codes', returning the decrypted codes. 
+        """
+        return decrypt_codes(codes, self.key_codes(len(codes)), self.algorithm)
+    
+    def encrypt(self, message):
+        """
+        Encrypts the string "message", returning the encrypted message. 
+        """
+        return codes_to_message(self.encrypt_buffer(message_to_codes(message)))
+    
+    def decrypt(self, message):
+        """
+        Decrypts the encrypted string "message", returning the decrypted message. 
+        """
+        return codes_to_message(self.decrypt_buffer(message_to_codes(message)))
+    
+    def encryptor(self):
+        """
+        Returns an incremental Encryptor() for this pin and algorithm. 
+        """
+        return Encryptor(algorithm=self.algorithm, seed=self.seed)
+    
+    def decryptor(self):
+        """
+        Returns an incremental Decryptor() for this pin and algorithm. 
+        """
+        return Decryptor(algorithm=self.algorithm, seed=self.seed)
+    
+    def encrypt_file(self, load_file_path, save_file_path):
+        """
+        Encrypts the text file load_file_path, and saves the result to save_file_path. 
+        """
+        message_to_file(self.encrypt(file_to_message(load_file_path)), save_file_path)
+    
+    def decrypt_file(self, load_file_path, save_file_path):
+        """
+        Decrypts the encrypted text file load_file_path, and saves the result to save_file_path. 
+        """
+        message_to_file(self.decrypt(file_to_message(load_file_path)), save_file_path)
+
+class Encryptor:
+    """
+    An incremental encryptor, in the style of hashlib: text is passed in through repeated
+    calls of update(chunk), each of which returns the encrypted text of that chunk straight
+    away, and finalize() is called at the end. 
+    
+    e.g. 
+    
+    encryptor = textencryptor.Encryptor(pin=123456)
+    for chunk in text_arriving_from_a_socket:
+        send(encryptor.update(chunk))
+    send(encryptor.finalize())
+    
+    The key stream (see next_key_codes()) and, for the cipher block chaining algorithm, 
+    the last encrypted block are carried from one chunk to the next, so the joined output 
+    is identical to encrypt_message() of the whole text. Each character is encrypted as 
+    soon as it arrives, so nothing is held back, and finalize() only closes the encryptor. 
+    
+    To continue (or start decrypting) part way through a message, give the position of 
+    the next character as "start", and the encrypted block before it as "iv" (see next_iv()). 
+    The key stream is then jumped straight to "start" (see jump_key_stream()). 
+    """
+    __slots__ = ('algorithm', 'seed', 'window', 'position', 'iv', 'finalized')
+    
+    def __init__(self, pin=None, algorithm='CBC', seed=None, start=0, iv=INITIAL_VALUE):
+        if pin == None and seed == None:
+            raise ValueError('An Encryptor needs a pin or a seed.')
+        self.algorithm = algorithm
+        self.seed = seed if seed != None else key_seed(pin)
+        if not self.seed:
+            raise ValueError('The pin must contain at least one library character.')
+        self.window = jump_key_stream(self.seed, 7*start) if start else self.seed
+        self.position = start# characters so far. 
+        self.iv = iv
+        self.finalized = False
+    
+    def next_key(self, n_char):
+        """
+        Returns the key stream for the next "n_char" characters as 'codes'. 
+        """
+        if self.finalized:
+            raise ValueError('update() called after finalize().')
+        if self.algorithm == 'CTR':
+            key = key_codes_segment(self.seed, self.position, n_char, self.algorithm)
+        else:
+            key, self.window = next_key_codes(self.window, n_char)
+        self.position += n_char
+        return key
+    
+    def update_codes(self, codes):
+        """
+        Encrypts the next chunk of the message given as 'codes', returning the encrypted codes. 
+        """
+        key = self.next_key(len(codes))
+        encrypted_codes = encrypt_codes(codes, key, self.algorithm, self.iv)
+        self.iv = next_iv(self.iv, encrypted_codes, self.algorithm)
+        return encrypted_codes
+    
+    def update(self, chunk):
+        """
+        Encrypts the next chunk (string) of the message, returning its encrypted text. 
+        """
+        return codes_to_message(self.update_codes(message_to_codes(chunk)))
+    
+    def finalize(self):
+        """
+        Ends the message. Returns the (empty) remaining encrypted text. 
+        """
+        self.finalized = True
+        return str()
+
+class Decryptor(Encryptor):
+    """
+    An incremental decryptor, the inverse of Encryptor(): encrypted text is passed in 
+    through repeated calls of update(chunk), each of which returns the decrypted text 
+    of that chunk, and finalize() is called at the end. 
+    """
+    __slots__ = ()
+    
+    def update_codes(self, codes):
+        """
+        Decrypts the next chunk of the encrypted message given as 'codes', returning the decrypted codes. 
+        """
+        key = self.next_key(len(codes))
+        decrypted_codes = decrypt_codes(codes, key, self.algorithm, self.iv)
+        self.iv = next_iv(self.iv, codes, self.algorithm)
+        return decrypted_codes
+
+KeyCacheInfo = namedtuple('KeyCacheInfo', ['hits', 'misses', 'extensions', 'evictions', 'entries', 'size', 'max_bytes'])
+
+class KeyStreamCache:
+    """
+    An in-process least recently used (LRU) cache of key streams, keyed by (pin, kind), 
+    where kind is how the key stream is stored ('codes', see key_codes(), or 'bytes', 
+    see key_bytes()). 
+    
+    A request for the key of a message no longer than the cached key stream returns a 
+    slice of it (a memoryview, so nothing is copied). A request for a longer key stream 
+    extends the cached one from where it ends (see next_key_codes()), rather than 
+    starting again from the seed. 
+    
+    The total size of the cached key streams is kept below "max_bytes" by evicting the 
+    least recently used key streams. A key stream larger than max_bytes is not cached. 
+    
+    cache_info() reports the number of hits, misses (new pins), extensions and evictions. 
+    
+    A KeyStreamCache may be shared by several threads (key_cache is used by every public 
+    function): the entries and statistics are guarded by a lock, which is not held while 
+    a key stream is generated. 
+    """
+    __slots__ = ('max_bytes', 'entries', 'size', 'hits', 'misses', 'extensions', 'evictions', 'lock')
+    
+    def __init__(self, max_bytes=KEY_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()# (pin, kind) -> [key stream, window at its end]
+        self.size = 0
+        self.hits = self.misses = self.extensions = self.evictions = 0
+    
+    def key_codes(self, pin, n_char, kind='codes'):
+        """
+        Returns the key stream of "pin" for a message of "n_char" characters as 'codes'
+        (or for "n_char" bytes of binary data if kind == 'bytes'). 
+        """
+        cache_key = (str(pin), kind)
+        with self.lock:
+            entry = self.entries.get(cache_key)
+            if entry == None:
+                self.misses += 1
+                entry = [b'', None]
+            elif n_char <= len(entry[0]):
+                self.hits += 1
+                self.entries.move_to_end(cache_key)
+                return memoryview(entry[0])[:n_char]
+            else:
+                self.extensions += 1
+        key, window = entry# generated outside the lock, from a snapshot of the entry. 
+        if window == None:
+            window = key_seed(pin)
+        n_new = max(n_char, 2*len(key))# grows at least geometrically ...
+        if n_new > self.max_bytes:
+            n_new = n_char# ... unless that would not fit. 
+        next_key = next_key_bytes if kind == 'bytes' else next_key_codes
+        extra, window = next_key(window, n_new - len(key))
+        key += extra
+        if len(key) > self.max_bytes:
+            return memoryview(key)[:n_char]
+        with self.lock:
+            entry = self.entries.pop(cache_key, None)
+            if entry != None:
+                self.size -= len(entry[0])
+                if len(entry[0]) > len(key):# another thread stored a longer key stream meanwhile. 
+                    key, window = entry
+            self.entries[cache_key] = [key, window]
+            self.size += len(key)
+            while self.size > self.max_bytes:
+                evicted_key, evicted_entry = self.entries.popitem(last=False)
+                self.size -= len(evicted_entry[0])
+                self.evictions += 1
+        return memoryview(key)[:n_char]
+    
+    def cache_info(self):
+        """
+        Returns the cache statistics, as a KeyCacheInfo named tuple. 
+        """
+        with self.lock:
+            return KeyCacheInfo(self.hits, self.misses, self.extensions, self.evictions, len(self.entries), self.size, self.max_bytes)
+    
+    def clear(self):
+        """
+        Empties the cache and resets its statistics. 
+        """
+        with self.lock:
+            self.entries = OrderedDict()
+            self.size = 0
+            self.hits = self.misses = self.extensions = self.evictions = 0
+
+key_cache = KeyStreamCache()# used by key_codes(), and so by all of the public functions. 
+
+class KeyStreamStore:
+    """
+    A persistent key stream store on disk, which can be shared by every process on a host. 
+    
+    Each key stream is kept as a file of 'codes' (one 7 binary digit block per byte, see 
+    key_codes()) in "directory", named by a hash of the pin. Files are memory mapped 
+    read-only, so all processes share a single copy through the operating system's page 
+    cache, and a key is returned as a memoryview of the mapped file, without copying. 
+    
+    When a longer key stream is needed than is stored, the rest is generated from where 
+    the stored key stream ends (see key_codes_segment()), written to a temporary file and 
+    moved into place with os.replace(), so other processes only ever see complete files. 
+    The total size of the store is kept below "max_bytes" by deleting the least recently 
+    used files. 
+    
+    To use a store for all of the public functions, set 
+    
+    textencryptor.key_store = textencryptor.KeyStreamStore('/path/to/store')
+    
+    IMPORTANT NOTE: The start of every key stream is the binary representation of its pin,
+    so the store directory (created with permissions 700) must be kept private. 
+    """
+    __slots__ = ('directory', 'max_bytes', 'maps')
+    
+    def __init__(self, directory, max_bytes=KEY_STORE_BYTES):
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.maps = {}# path -> memory map of the file, in this process. 
+    
+    def path(self, pin, kind='codes'):
+        """
+        The path of the file holding the key stream of "pin". 
+        """
+        name = hashlib.sha256(f'{kind}:{pin}'.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name + '.key')
+    
+    def open_map(self, path):
+        """
+        Memory maps the file at "path" (read-only), returns None if there is no such file. 
+        """
+        try:
+            fp = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        with fp:
+            if os.fstat(fp.fileno()).st_size == 0:
+                return None
+            self.maps[path] = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.maps[path]
+    
+    def key_codes(self, pin, n_char, kind='codes'):
+        """
+        Returns the key stream of "pin" for a message of "n_char" characters as 'codes'
+        (or for "n_char" bytes of binary data if kind == 'bytes'). 
+        """
+        if n_char == 0:
+            return memoryview(b'')
+        path = self.path(pin, kind)
+        key = self.maps.get(path)
+        if key == None or len(key) < n_char:
+            key = self.open_map(path) or key# another process may have extended it. 
+        if key == None or len(key) < n_char:
+            return self.extend(pin, path, key, n_char, kind)
+        try:
+            os.utime(path)# marks the file as recently used. 
+        except FileNotFoundError:
+            pass
+        return memoryview(key)[:n_char]
+    
+    def extend(self, pin, path, key, n_char, kind='codes'):
+        """
+        Extends (or creates) the stored key stream of "pin" to at least "n_char" codes (or bytes). 
+        """
+        key_segment = key_bytes_segment if kind == 'bytes' else key_codes_segment
+        n_stored = len(key) if key != None else 0
+        n_new = max(n_char, 2*n_stored)# grows at least geometrically ...
+        if n_new > self.max_bytes:
+            n_new = n_char# ... unless that would not fit. 
+        if n_new > self.max_bytes:
+            return memoryview(key_segment(key_seed(pin), 0, n_char))
+        extra = key_segment(key_seed(pin), n_stored, n_new - n_stored)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fp:
+            if key != None:
+                fp.write(key)
+            fp.write(extra)
+        os.replace(temp_path, path)
+        self.evict(keep=path)
+        return memoryview(self.open_map(path))[:n_char]
+    
+    def evict(self, keep=None):
+        """
+        Deletes the least recently used key stream files until the store is below max_bytes. 
+        """
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.key') and entry.path != keep:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for mtime, size, file_path in files)
+        if keep != None and os.path.exists(keep):
+            total += os.path.getsize(keep)
+        for mtime, size, file_path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(file_path)# processes which have it mapped keep their copy. 
+            except FileNotFoundError:
+                pass
+            self.maps.pop(file_path, None)
+            total -= size
+    
+    def close(self):
+        """
+        Releases this process's memory maps of the store. 
+        """
+        self.maps.clear()
+
+key_store = None# if set to a KeyStreamStore, key_codes() uses it in place of key_cache. 
+
+class LineIndex:
+    """
+    A sidecar index of the lines of an encrypted file, written by encrypt_file(index_every=N) 
+    to the file name of the encrypted file + '.idx'. 
+    
+    '\\n' is a library character, so the lines of the message are also lines of the encrypted 
+    characters. For every Nth line (0, N, 2N, ...) the index records the position of its first 
+    character, its byte offset in the encrypted file, and the 8 encrypted characters before it 
+    (all that the cipher block chaining algorithms need to start decrypting there, see next_iv()). 
+    read_encrypted_lines() then seeks straight to the nearest indexed line before the lines 
+    it is asked for. 
+    
+    The file is a header (magic, version, N, number of lines, number of characters, and the 
+    size in bytes and last 8 encrypted characters of the encrypted file) followed by one fixed 
+    size entry per indexed line. The size and last characters let for_file() tell an index 
+    which no longer matches its file (e.g. the file was encrypted again) from one which does. 
+    
+    NOTE: the index shows where the lines of the message begin, and so their lengths. 
+    """
+    __slots__ = ('every', 'container', 'entries', 'n_lines', 'n_char', 'n_byte', 'previous', 'last')
+    
+    def __init__(self, every, container=False):
+        self.every = every
+        self.container = container# byte offsets are then fixed by the character positions. 
+        self.entries = [(0, CONTAINER_HEADER.size if container else 0, bytes([INITIAL_VALUE])*8)]
+        self.n_lines = 0# line endings so far. 
+        self.n_char = 0
+        self.n_byte = 0
+        self.previous = bytes([INITIAL_VALUE])*8# the last 8 encrypted characters so far. 
+        self.last = None# the last character of the message so far. 
+    
+    def add(self, codes, encrypted_codes):
+        """
+        Adds the next chunk of the message, given as its 'codes' and encrypted codes. 
+        """
+        codes, encrypted_codes = bytes(codes), bytes(encrypted_codes)
+        widths = encrypted_codes.translate(CODE_WIDTHS)# bytes of each character in UTF-8. 
+        mark = 0# characters of the chunk counted into n_byte. 
+        end = codes.find(NEWLINE_CODE)
+        while end != -1:
+            self.n_lines += 1
+            if self.n_lines % self.every == 0:
+                start = end + 1
+                self.n_byte += sum(widths[mark:start])
+                mark = start
+                previous = (self.previous + encrypted_codes[max(0, start-8):start])[-8:]
+                if self.container:
+                    offset = CONTAINER_HEADER.size + 7*((self.n_char + start)//8)
+                else:
+                    offset = self.n_byte
+                self.entries.append((self.n_char + start, offset, previous))
+            end = codes.find(NEWLINE_CODE, end + 1)
+        self.n_byte += sum(widths[mark:])
+        self.n_char += len(codes)
+        self.previous = (self.previous + encrypted_codes[-8:])[-8:]
+        if codes:
+            self.last = codes[-1]
+    
+    def lines(self):
+        """
+        The number of lines in the message (a last line without a line ending is counted). 
+        """
+        return self.n_lines + (self.last != None and self.last != NEWLINE_CODE)
+    
+    def save(self, file_name):
+        """
+        Saves the index to the file file_name. 
+        """
+        n_byte = CONTAINER_HEADER.size + (7*self.n_char + 7)//8 if self.container else self.n_byte
+        with open(file_name, 'wb') as fp:
+            fp.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, self.every, self.lines(), self.n_char, n_byte, self.previous))
+            for entry in self.entries:
+                fp.write(INDEX_ENTRY.pack(*entry))
+    
+    def resume(self, tail, last, n_byte=0, container=False):
+        """
+        Prepares an index read by load() for more of the message to be added (see 
+        append_encrypted()). "tail" is the last (up to 8) encrypted characters so far, 
+        "last" the last character of the message (None if it is empty) and "n_byte" 
+        the size of the encrypted text file. 
+        """
+        self.container = container
+        self.n_lines -= (last != None and last != NEWLINE_CODE)# back to line endings. 
+        self.n_byte = n_byte
+        self.previous = next_iv(INITIAL_VALUE, tail, 'CBC56')# the last 8, see next_iv(). 
+        self.last = last
+    
+    @classmethod
+    def build(cls, file_name, pin, algorithm='CBC', every=1):
+        """
+        Builds the index of a file encrypted by encrypt_file() (and not yet indexed) by
+        decrypting it, a CHUNK_SIZE at a time. 
+        """
+        info = container_info(file_name)
+        if info != None:
+            algorithm = info[0]
+            code_chunks = container_to_code_chunks(file_name)
+        else:
+            code_chunks = file_to_code_chunks(file_name)
+        index = cls(every, info != None)
+        decryptor = Decryptor(pin, algorithm)
+        for encrypted_codes in code_chunks:
+            index.add(decryptor.update_codes(encrypted_codes), encrypted_codes)
+        return index
+    
+    @classmethod
+    def load(cls, file_name):
+        """
+        Reads an index saved by save(). Only "every", "entries", "n_lines" (here the number 
+        of lines), "n_char", "n_byte" (here the size of the encrypted file) and "previous" 
+        are restored. 
+        """
+        with open(file_name, 'rb') as fp:
+            data = fp.read()
+        if data[:4] != INDEX_MAGIC:
+            raise ValueError(f'{file_name} is not a line index file.')
+        if data[4:5] != bytes([INDEX_VERSION]):# before unpacking, as other versions have other headers. 
+            raise ValueError(f'Unsupported line index version {int.from_bytes(data[4:5], "big")}.')
+        magic, version, every, n_lines, n_char, n_byte, previous = INDEX_HEADER.unpack_from(data)
+        index = cls(every)
+        index.entries = list(INDEX_ENTRY.iter_unpack(data[INDEX_HEADER.size:]))
+        index.n_lines, index.n_char, index.n_byte, index.previous = n_lines, n_char, n_byte, previous
+        return index
+    
+    def matches(self, file_name):
+        """
+        Whether an index read by load() is still the index of the encrypted file file_name, 
+        i.e. the file has the size and ends with the 8 encrypted characters recorded when 
+        the index was saved. Only the end of the file is read. 
+        """
+        if os.path.getsize(file_name) != self.n_byte:
+            return False
+        return next_iv(INITIAL_VALUE, file_tail_codes(file_name, min(self.n_char, 8)), 'CBC56') == self.previous
+    
+    @classmethod
+    def for_file(cls, file_name):
+        """
+        Reads the index of the encrypted file file_name (from file_name + '.idx'). Returns 
+        None if there is no index, if file_name + '.idx' is not a line index file (of this 
+        version), or if it no longer matches the file (see matches()), so that the file is 
+        then read as if it had no index. 
+        """
+        index_path = file_name + '.idx'
+        if not (os.path.exists(file_name) and os.path.isfile(index_path)):
+            return None
+        try:
+            index = cls.load(index_path)
+        except (ValueError, struct.error):
+            return None
+        return index if index.matches(file_name) else None
+
 def send_encrypted_email(your_email=None, their_email=None, subject='A message', pre_text='', post_text='', message_to_be_encrypted=None, pin = None):    
     """
     Encrypts a message with encrypt_message() and then sends it by email. 